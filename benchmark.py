@@ -0,0 +1,300 @@
+import argparse
+import csv
+import io
+import json
+import multiprocessing as mp
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from events import EVENT_TYPES, read_events
+from util import OrchardManager, ShmFruitTree
+from validate_events import validate
+from virtual_engine import VirtualOrchard
+
+BENCH_PICKERS = [4, 16, 64]
+BENCH_BACKENDS = ['manager', 'shm']
+BENCH_TREE_SIZES = [26, 1_000, 100_000, 1_000_000]
+BENCH_VIRTUAL = [(26, 3), (10_000, 100), (1_000_000, 1000)]  # (fruits, pickers)
+BENCH_ENGINES = ['process', 'virtual']
+SWEEP_KEY = ('fruits', 'pickers', 'capacity', 'backend', 'start_method')
+
+
+def run_point(fruits, pickers, capacity, backend, batch=1, crates=1, load_delay=0.0):
+    """Run main.py once with output discarded and return the wall time in seconds"""
+    script = os.path.join(os.path.dirname(__file__), "main.py")
+    cmd = [sys.executable, script,
+           "--fruits", str(fruits),
+           "--pickers", str(pickers),
+           "--capacity", str(capacity),
+           "--backend", backend,
+           "--batch", str(batch),
+           "--crates", str(crates),
+           "--load-delay", str(load_delay)]
+    start = time.perf_counter()
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def run_backends(fruits, capacity, batch=1, crates=1, load_delay=0.0):
+    """Print fruits/sec for every backend and picker count"""
+    print(f"{'pickers':>8} | " + " | ".join(f"{b + ' fruits/s':>16}" for b in BENCH_BACKENDS))
+    for pickers in BENCH_PICKERS:
+        rates = [fruits / run_point(fruits, pickers, capacity, b, batch, crates, load_delay) for b in BENCH_BACKENDS]
+        print(f"{pickers:>8} | " + " | ".join(f"{r:>16.1f}" for r in rates))
+
+
+def time_pops(tree, pops):
+    """Mean time in microseconds of one pop_random() under tree_lock"""
+    lock = mp.Lock()
+    start = time.perf_counter()
+    for _ in range(pops):
+        with lock:
+            tree.pop_random()
+    return (time.perf_counter() - start) / pops * 1e6
+
+
+def run_tree_sizes(pops):
+    """Print the tree_lock hold time per pick for growing tree sizes"""
+    manager = OrchardManager()
+    manager.start()
+    print(f"{'fruits':>10} | " + " | ".join(f"{b + ' us/pick':>16}" for b in BENCH_BACKENDS))
+    for size in BENCH_TREE_SIZES:
+        n = min(pops, size)
+        fruit_ids = range(1, size + 1)
+        hold = [time_pops(manager.FruitTree(fruit_ids), n), time_pops(ShmFruitTree(fruit_ids), n)]
+        print(f"{size:>10} | " + " | ".join(f"{h:>16.2f}" for h in hold))
+    manager.shutdown()
+
+
+def run_virtual(capacity, batch=1, crates=1, loaders=1, trees=1):
+    """Print simulated events/sec of the virtual engine, no output"""
+    print(f"{'fruits':>10} | {'pickers':>8} | {'events':>10} | {'seconds':>8} | {'events/s':>10}")
+    for fruits, pickers in BENCH_VIRTUAL:
+        orchard = VirtualOrchard(fruits, pickers, capacity, batch, crates, loaders, trees)
+        start = time.perf_counter()
+        count = orchard.run()
+        elapsed = time.perf_counter() - start
+        print(f"{fruits:>10} | {pickers:>8} | {count:>10} | {elapsed:>8.2f} | {count / elapsed:>10.0f}")
+
+
+def event_stats(engine, fruits, pickers, capacity, seed):
+    """Per-fruit count of every event type and the spread of picks over the pickers for one run"""
+    script = os.path.join(os.path.dirname(__file__), "main.py")
+    cmd = [sys.executable, script, "--fruits", str(fruits), "--pickers", str(pickers), "--capacity", str(capacity),
+           "--backend", "shm", "--engine", engine, "--seed", str(seed), "--events", "jsonl"]
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+    _, events = read_events(io.BytesIO(out))
+    counts = Counter()
+    picks = Counter()
+    for event in events:
+        counts[event.event] += 1
+        if event.event == 'picked':
+            picks[event.actor] += 1
+    shares = [picks[f"Picker-{i}"] / fruits for i in range(1, pickers + 1)]
+    return {kind: n / fruits for kind, n in counts.items()}, statistics.pstdev(shares)
+
+
+def run_engines(fruits, pickers, capacity, repeats):
+    """Print the mean per-fruit event counts of both engines side by side"""
+    results = {}
+    for engine in BENCH_ENGINES:
+        runs = [event_stats(engine, fruits, pickers, capacity, seed) for seed in range(repeats)]
+        results[engine] = ({kind: statistics.mean(r[0].get(kind, 0) for r in runs) for kind in EVENT_TYPES},
+                           statistics.mean(r[1] for r in runs))
+    print(f"{'per fruit':>14} | " + " | ".join(f"{e:>10}" for e in BENCH_ENGINES))
+    for kind in EVENT_TYPES:
+        if any(results[e][0][kind] for e in BENCH_ENGINES):
+            print(f"{kind:>14} | " + " | ".join(f"{results[e][0][kind]:>10.3f}" for e in BENCH_ENGINES))
+    print(f"{'pick share sd':>14} | " + " | ".join(f"{results[e][1]:>10.3f}" for e in BENCH_ENGINES))
+
+
+def measure(fruits, pickers, capacity, backend, start_method, latency=True):
+    """
+    Run main.py once and return wall time, fruits/s, pick-to-load latency percentiles and peak RSS.
+    The latencies come from the jsonl events (picked ts of every fruit to the ts of the crate loading it),
+    which are also checked by validate_events, without latency the run prints nothing.
+    Peak RSS is the largest process of the run (wait4 ru_maxrss).
+    """
+    script = os.path.join(os.path.dirname(__file__), "main.py")
+    cmd = [sys.executable, script, "--fruits", str(fruits), "--pickers", str(pickers), "--capacity", str(capacity),
+           "--backend", backend, "--start-method", start_method]
+    cmd += ["--events", "jsonl"] if latency else ["--output", "none"]
+    with tempfile.TemporaryFile() as out:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=out)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        # (reaped here, the Popen would never learn its exit code otherwise)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed with exit code {proc.returncode}")
+        result = {'wall': wall, 'fruits_per_s': fruits / wall, 'peak_rss_mb': usage.ru_maxrss / 1024}
+        if latency:
+            out.seek(0)
+            result.update(pick_to_load(read_events(out)[1]))
+            out.seek(0)
+            result['violations'] = validate(*read_events(out))[0]
+    return result
+
+
+def pick_to_load(events):
+    """Percentiles of the time from a fruit being picked to its crate being loaded, in milliseconds"""
+    picked = {}
+    latencies = []
+    for event in events:
+        if event.event == 'picked':
+            picked[event.fruit] = event.ts
+        elif event.event in ('loading', 'partial'):
+            latencies.extend(event.ts - picked[fruit] for fruit in event.fruits)
+    latencies.sort()
+    if not latencies:
+        return {}
+
+    def at(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3
+
+    return {'latency_p50_ms': at(0.5), 'latency_p90_ms': at(0.9), 'latency_p99_ms': at(0.99),
+            'latency_max_ms': latencies[-1] * 1e3}
+
+
+def summarize(runs):
+    """One entry per sweep point: mean/sd of throughput and wall time, median latencies, max RSS"""
+    points = {}
+    for run in runs:
+        points.setdefault(tuple(run[k] for k in SWEEP_KEY), []).append(run)
+    summary = []
+    for key, group in points.items():
+        rates = [r['fruits_per_s'] for r in group]
+        walls = [r['wall'] for r in group]
+        entry = dict(zip(SWEEP_KEY, key), repeats=len(group),
+                     fruits_per_s=statistics.mean(rates), fruits_per_s_sd=statistics.pstdev(rates),
+                     wall=statistics.mean(walls), wall_sd=statistics.pstdev(walls),
+                     peak_rss_mb=max(r['peak_rss_mb'] for r in group))
+        for name in ('latency_p50_ms', 'latency_p90_ms', 'latency_p99_ms', 'latency_max_ms'):
+            if name in group[0]:
+                entry[name] = statistics.median(r[name] for r in group)
+        summary.append(entry)
+    return summary
+
+
+def run_sweep(fruits_list, pickers_list, capacities, backends, start_methods, repeats, latency=True):
+    """Measure every point of the grid repeats times, printing a line per point"""
+    runs = []
+    print(f"{'fruits':>7} | {'pickers':>7} | {'cap':>4} | {'backend':>7} | {'start':>10} | {'fruits/s':>14} | "
+          f"{'p50 ms':>8} | {'p99 ms':>8} | {'rss MB':>7}")
+    for fruits in fruits_list:
+        for pickers in pickers_list:
+            for capacity in capacities:
+                for backend in backends:
+                    for start_method in start_methods:
+                        point = dict(fruits=fruits, pickers=pickers, capacity=capacity, backend=backend,
+                                     start_method=start_method)
+                        group = [dict(point, repeat=i, **measure(fruits, pickers, capacity, backend, start_method,
+                                                                  latency))
+                                 for i in range(repeats)]
+                        runs += group
+                        entry = summarize(group)[0]
+                        if any(r.get('violations') for r in group):
+                            print(f"invalid event log: python main.py -f {fruits} -p {pickers} -c {capacity} "
+                                  f"-b {backend} -e jsonl | python validate_events.py")
+                        print(f"{fruits:>7} | {pickers:>7} | {capacity:>4} | {backend:>7} | {start_method:>10} | "
+                              f"{entry['fruits_per_s']:>8.1f} ±{entry['fruits_per_s_sd']:>5.1f} | "
+                              f"{entry.get('latency_p50_ms', 0):>8.1f} | {entry.get('latency_p99_ms', 0):>8.1f} | "
+                              f"{entry['peak_rss_mb']:>7.1f}", flush=True)
+    return runs
+
+
+def write_results(runs, csv_path=None, json_path=None):
+    if csv_path:
+        fields = list(dict.fromkeys(k for run in runs for k in run))
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(runs)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'runs': runs, 'points': summarize(runs)}, f, indent=1)
+
+
+def compare(points, baseline_path, tolerance):
+    """
+    Compare sweep points with a saved --json file. Throughput lower, p99 latency or peak RSS higher than
+    the baseline by more than tolerance is a regression. Returns the number of regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = {tuple(p[k] for k in SWEEP_KEY): p for p in json.load(f)['points']}
+    checks = [('fruits_per_s', -1), ('latency_p99_ms', 1), ('peak_rss_mb', 1)]  # (metric, bad direction)
+    regressions = 0
+    print(f"\nagainst {baseline_path} (tolerance {tolerance:.0%})")
+    for point in points:
+        key = tuple(point[k] for k in SWEEP_KEY)
+        label = " ".join(f"{k}={v}" for k, v in zip(SWEEP_KEY, key))
+        if key not in baseline:
+            print(f"  new        {label}")
+            continue
+        for metric, direction in checks:
+            if metric not in point or metric not in baseline[key] or not baseline[key][metric]:
+                continue
+            change = point[metric] / baseline[key][metric] - 1
+            if change * direction > tolerance:
+                regressions += 1
+                print(f"  REGRESSION {label} {metric} {baseline[key][metric]:.1f} -> {point[metric]:.1f} "
+                      f"({change:+.0%})")
+            elif -change * direction > tolerance:
+                print(f"  better     {label} {metric} {baseline[key][metric]:.1f} -> {point[metric]:.1f} "
+                      f"({change:+.0%})")
+    print(f"{regressions} regression(s)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fruits", "-f", type=int, default=500)
+    parser.add_argument("--capacity", "-c", type=int, default=12)
+    parser.add_argument("--batch", "-k", type=int, default=1)
+    parser.add_argument("--crates", "-n", type=int, default=1)
+    parser.add_argument("--load-delay", type=float, default=0.0)
+    parser.add_argument("--tree-sizes", action="store_true",
+                        help="measure tree_lock hold time per pick from 26 to 1M fruits instead")
+    parser.add_argument("--pops", type=int, default=2000)
+    parser.add_argument("--virtual", action="store_true",
+                        help="measure simulated events/sec of the virtual engine up to 1M fruits x 1000 pickers instead")
+    parser.add_argument("--engines", action="store_true",
+                        help="compare event counts of the process and virtual engines on a small case instead")
+    parser.add_argument("--pickers", "-p", type=int, default=3, help="pickers for --engines")
+    parser.add_argument("--repeats", type=int, default=None,
+                        help="runs per engine for --engines (default: 5), per point for --sweep (default: 3)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="measure throughput, pick-to-load latency and peak RSS over a grid instead")
+    parser.add_argument("--sweep-fruits", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--sweep-pickers", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--sweep-capacity", type=int, nargs="+", default=[12])
+    parser.add_argument("--backends", nargs="+", choices=BENCH_BACKENDS, default=BENCH_BACKENDS)
+    parser.add_argument("--start-methods", nargs="+", choices=mp.get_all_start_methods(), default=["spawn"])
+    parser.add_argument("--no-latency", action="store_true",
+                        help="run the sweep with --output none, no events and no latencies")
+    parser.add_argument("--csv", metavar="FILE", help="write every sweep run to FILE")
+    parser.add_argument("--json", metavar="FILE", help="write the sweep runs and per-point summary to FILE")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="flag sweep points that regressed against a saved --json file, exit 1 if any did")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="relative change --compare lets through (default: 0.15)")
+    args = parser.parse_args()
+    if args.sweep:
+        runs = run_sweep(args.sweep_fruits, args.sweep_pickers, args.sweep_capacity, args.backends,
+                         args.start_methods, args.repeats or 3, not args.no_latency)
+        write_results(runs, args.csv, args.json)
+        if args.compare and compare(summarize(runs), args.compare, args.tolerance):
+            sys.exit(1)
+    elif args.tree_sizes:
+        run_tree_sizes(args.pops)
+    elif args.virtual:
+        run_virtual(args.capacity, args.batch, args.crates)
+    elif args.engines:
+        run_engines(args.fruits, args.pickers, args.capacity, args.repeats or 5)
+    else:
+        run_backends(args.fruits, args.capacity, args.batch, args.crates, args.load_delay)
@@ -5,14 +5,25 @@ FPS = 30
 FONT_SIZE = 18
 HEADER_FONT_SIZE = 20
 MAX_LOG_LINES = 15
+FRUIT_DENSITY_THRESHOLD = 5000  # a tree with more fruits than this is drawn as a density map
+DENSITY_CELL = 4  # pixels per density map cell
+PICKER_LOD_THRESHOLD = 10  # more pickers than this are drawn grouped, a count and a dot per picker at each place
+PICKER_DOT_SPACING = 8  # pixels between the dots of grouped pickers
+METRICS_SAMPLE = 100  # events per metrics panel sample (at least one per actor)
+METRICS_WINDOW = 10  # samples the panel's rates and ratios are taken over
+SPARKLINE_POINTS = 60  # samples of history a sparkline shows
+MAX_DIRTY_RECTS = 64  # more changed areas than this in a frame and it is redrawn whole
+TEXT_CACHE_SIZE = 512  # rendered text surfaces the UI keeps (labels, states, log lines)
 DEFAULT_EVENT_DELAY = 0.5
+EVENT_QUEUE_SIZE = 10000  # events buffered between main.py and the UI
 PADDING = 10
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 620
 
 # Speed settings
-SPEED_LEVELS = [1.5, 1.0, 0.5, 0.25, 0.1]  # Slower to faster (delay in seconds)
+SPEED_LEVELS = [1.5, 1.0, 0.5, 0.25, 0.1, 0]  # Slower to faster (delay in seconds), 0 is unthrottled
 DEFAULT_SPEED_INDEX = 2  # Index 2 corresponds to 0.5 seconds (default speed)
+FRAME_BUDGET = 0.6 / FPS  # seconds of each frame unthrottled playback spends applying events
 
 # Colors
 WHITE = (245, 245, 245)
@@ -35,7 +46,9 @@ TREE_RADIUS = 220
 FRUIT_Y_OFFSET = 20
 CRATE_RECT = pygame.Rect(570, 360, 160, 120)
 TRUCK_RECT = pygame.Rect(700, 30, 140, 140)
+TRUCK_AREA_LEFT = 340  # extra trucks (one per loader) park between here and TRUCK_RECT
 TEXT_AREA_X = 850
+TIMELINE_RECT = pygame.Rect(30, SCREEN_HEIGHT - 36, TEXT_AREA_X - 60, 12)  # replay timeline
 LOADER_SIZE = 150  # loader image size
 
 # UI Enhancement
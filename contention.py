@@ -0,0 +1,150 @@
+import json
+import multiprocessing as mp
+import sys
+import time
+
+BUCKETS = 32  # log2 microsecond buckets: 0 is < 1us, b is [2^(b-1), 2^b) us, the last one takes the rest
+KINDS = ('wait', 'hold')
+
+
+def bucket_of(seconds):
+    return min(int(seconds * 1e6).bit_length(), BUCKETS - 1)
+
+
+def bucket_edge(bucket):
+    """Upper edge of a bucket in microseconds"""
+    return 2 ** bucket
+
+
+class Contention:
+    """
+    Acquire-wait and hold-time histograms per actor and primitive, in shared memory.
+    Every actor only writes its own rows, so recording needs no lock.
+    """
+    def __init__(self, actors, primitives):
+        self.actors = list(actors)
+        self.primitives = list(primitives)
+        rows = len(self.actors) * len(self.primitives) * len(KINDS)
+        self.counts = mp.RawArray('Q', rows * BUCKETS)
+        self.totals = mp.RawArray('d', rows)  # seconds
+
+    def row(self, actor, primitive, kind):
+        return ((self.actors.index(actor) * len(self.primitives) + self.primitives.index(primitive)) * len(KINDS)
+                + KINDS.index(kind))
+
+    def record(self, row, seconds):
+        self.counts[row * BUCKETS + bucket_of(seconds)] += 1
+        self.totals[row] += seconds
+
+    def wrap(self, primitive, actor, name, hold=True):
+        """Timed stand-in for a lock/semaphore (hold=False for semaphores, their permits move between actors)"""
+        return TimedLock(primitive, self, self.row(actor, name, 'wait'),
+                         self.row(actor, name, 'hold') if hold else None)
+
+    def wrap_queue(self, queue, actor, name):
+        return TimedQueue(queue, self, self.row(actor, name, 'wait'))
+
+    def histogram(self, row):
+        return list(self.counts[row * BUCKETS:(row + 1) * BUCKETS])
+
+    def report(self):
+        """
+        {primitive: {kind: {count, total, mean, p50, p99, histogram, actors: {actor: {count, total, histogram}}}}},
+        times in seconds, histograms in log2 microsecond buckets.
+        """
+        report = {}
+        for primitive in self.primitives:
+            entry = {}
+            for kind in KINDS:
+                merged = [0] * BUCKETS
+                total = 0.0
+                actors = {}
+                for actor in self.actors:
+                    row = self.row(actor, primitive, kind)
+                    hist = self.histogram(row)
+                    if any(hist):
+                        actors[actor] = {'count': sum(hist), 'total': self.totals[row], 'histogram': hist}
+                        merged = [a + b for a, b in zip(merged, hist)]
+                        total += self.totals[row]
+                count = sum(merged)
+                if count:
+                    entry[kind] = {'count': count, 'total': total, 'mean': total / count,
+                                   'p50': percentile(merged, 0.5), 'p99': percentile(merged, 0.99),
+                                   'histogram': merged, 'actors': actors}
+            if entry:
+                report[primitive] = entry
+        return report
+
+    def print_report(self, file=sys.stderr):
+        """Contention table, one line per primitive and kind with the actor that spent the most time in it"""
+        report = self.report()
+        print(f"\n{'primitive':>14} | {'kind':>4} | {'count':>9} | {'total s':>9} | {'mean us':>9} | "
+              f"{'p50 us':>8} | {'p99 us':>8} | top actor", file=file)
+        for primitive, entry in report.items():
+            for kind, stats in entry.items():
+                top = max(stats['actors'].items(), key=lambda item: item[1]['total'])
+                share = top[1]['total'] / stats['total'] * 100 if stats['total'] else 0
+                print(f"{primitive:>14} | {kind:>4} | {stats['count']:>9} | {stats['total']:>9.3f} | "
+                      f"{stats['mean'] * 1e6:>9.1f} | {stats['p50'] * 1e6:>8.0f} | {stats['p99'] * 1e6:>8.0f} | "
+                      f"{top[0]} ({share:.0f}%)", file=file)
+        file.flush()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({'buckets': 'log2 microseconds', 'primitives': self.report()}, f, indent=1)
+
+
+def percentile(histogram, fraction):
+    """Upper bucket edge (seconds) below which fraction of the samples fall"""
+    target = sum(histogram) * fraction
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= target:
+            return bucket_edge(bucket) / 1e6
+    return 0.0
+
+
+class TimedLock:
+    """
+    Lock or semaphore that records how long acquire() waited and, for locks, how long it was held.
+    Non-blocking acquires that fail are not recorded.
+    """
+    def __init__(self, lock, contention, wait_row, hold_row=None):
+        self.lock = lock
+        self.contention = contention
+        self.wait_row = wait_row
+        self.hold_row = hold_row
+        self.acquired_at = 0.0
+
+    def acquire(self, block=True):
+        start = time.perf_counter()
+        acquired = self.lock.acquire(block)
+        if acquired:
+            self.acquired_at = time.perf_counter()
+            self.contention.record(self.wait_row, self.acquired_at - start)
+        return acquired
+
+    def release(self):
+        if self.hold_row is not None:
+            self.contention.record(self.hold_row, time.perf_counter() - self.acquired_at)
+        self.lock.release()
+
+
+class TimedQueue:
+    """
+    Queue whose get() records how long it waited, put() passes straight through.
+    """
+    def __init__(self, queue, contention, wait_row):
+        self.queue = queue
+        self.contention = contention
+        self.wait_row = wait_row
+
+    def get(self):
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.contention.record(self.wait_row, time.perf_counter() - start)
+        return item
+
+    def put(self, item):
+        self.queue.put(item)
@@ -1,37 +1,145 @@
+import multiprocessing as mp
+import os
+import queue
+import signal
 import subprocess
 import sys
+import threading
 import time
-from config import MAX_LOG_LINES
+from collections import deque
+from config import MAX_LOG_LINES, EVENT_QUEUE_SIZE
+from events import read_events, format_state, JsonlWriter
 
 
 class EventProcessor:
-    """Handles processing of simulation events from external process output"""
+    """
+    Handles processing of simulation events streamed from main.py while it runs, or read back from a
+    recorded event log (replay.Replay).
+    engine=None starts nothing, the events are fed through apply() (that is how replay.py builds its index).
+    metrics (metrics.Metrics) is fed every event applied.
+    """
     
-    def __init__(self, fruits, pickers, capacity, simulation_state):
+    ENGINES = ('subprocess', 'inprocess')
+
+    def __init__(self, fruits, pickers, capacity, simulation_state, loaders=1, trees=1, engine='subprocess',
+                 replay=None, record=None, metrics=None):
         """Initialize the event processor with simulation parameters"""
         self.simulation_state = simulation_state
+        self.metrics = metrics
         self.log = []
         
-        # Fetch CLI output from main.py
-        self._fetch_simulation_events(fruits, pickers, capacity)
-        
+        self.stream_ended = False
+        self.meta = None
+        self.proc = None
+        self.replay = replay
+        self.record = record  # path the live stream is saved to, indexed once it ends
+
         # Tracking
-        self.current_index = 0
+        self.current_index = 0  # events processed so far
+
+        # Start the simulation and stream its events, None marks the end of the stream
+        if replay is not None:
+            self.meta = replay.meta
+            self.replay_events = replay.read(replay.start)
+        elif engine == 'inprocess':
+            self._start_engine(fruits, pickers, capacity, loaders, trees)
+        elif engine == 'subprocess':
+            self._start_simulation(fruits, pickers, capacity, loaders, trees)
+        
         self.last_time = time.time()
-        self.pending_tree_updates = []  # Track pending fruit removal
+        self.pending_tree_updates = deque()  # Track pending fruit removal, (pick id, tree) oldest first
+        self.pending_picks = set()  # the pick ids in pending_tree_updates
         
         # Track previous states per picker to avoid duplicate updates
         self.previous_picker_states = {name: '' for name in simulation_state.states.keys()}
         
-    def _fetch_simulation_events(self, fruits, pickers, capacity):
-        """Run main.py as subprocess and capture output"""
+    def _start_simulation(self, fruits, pickers, capacity, loaders, trees):
+        """Run main.py as subprocess and read its event records on a background thread"""
+        # Bounded hand-off between the reader thread and process_next.
+        # When the UI falls behind the reader blocks, the pipe fills up and main.py waits - memory stays flat.
+        self.events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
         cmd = [sys.executable, 'main.py',
                '--fruits', str(fruits),
                '--pickers', str(pickers),
-               '--capacity', str(capacity)]
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        out, _ = proc.communicate()
-        self.raw_events = out.splitlines()[2:]  # Skip header lines
+               '--capacity', str(capacity),
+               '--loaders', str(loaders),
+               '--trees', str(trees),
+               '--events', 'jsonl']
+        # own process group, so closing early can stop the pickers and loaders along with main.py
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, start_new_session=(os.name == 'posix'))
+        self.reader = threading.Thread(target=self._read_events, daemon=True)
+        self.reader.start()
+
+    def _start_engine(self, fruits, pickers, capacity, loaders, trees):
+        """Host the picker/loader engine here: its processes hand Event records over a queue, no text round-trip"""
+        from main import run_orchard  # only the in-process engine needs util and colorama
+
+        # the EventMerger puts the records in seq order (SimpleQueue has no feeder thread that could
+        # reorder them), the reader thread moves them into the bounded queue
+        self.events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.engine_events = mp.SimpleQueue()
+        self.meta = {'fruits': fruits, 'pickers': pickers, 'capacity': capacity, 'loaders': loaders, 'trees': trees,
+                     'actors': self.simulation_state.picker_names + self.simulation_state.loader_names}
+        # run_orchard blocks until the run is over, so it gets a thread of its own
+        self.engine = threading.Thread(
+            target=run_orchard, daemon=True,
+            kwargs=dict(num_fruits=fruits, num_pickers=pickers, crate_capacity=capacity, backend='shm',
+                        num_loaders=loaders, num_trees=trees, event_queue=self.engine_events))
+        self.engine.start()
+        self.reader = threading.Thread(target=self._read_engine_events, daemon=True)
+        self.reader.start()
+
+    def _read_engine_events(self):
+        """Reader thread: move records from the engine queue into the bounded queue"""
+        self._forward(iter(self.engine_events.get, None))
+
+    def _read_events(self):
+        """Reader thread: move records from the pipe into the bounded queue"""
+        try:
+            self.meta, events = read_events(self.proc.stdout)
+        except Exception:
+            self.events.put(None)  # main.py died before its header
+            raise
+        self._forward(events)
+
+    def _forward(self, events):
+        """Put the events into the bounded queue, and into the --record file if there is one"""
+        if self.record is None:
+            try:
+                for event in events:
+                    self.events.put(event)
+            finally:
+                self.events.put(None)
+            return
+
+        with open(self.record, 'wb') as f:
+            writer = JsonlWriter(f)
+            writer.write_header(self.meta)
+            try:
+                for event in events:
+                    writer.write(event)
+                    self.events.put(event)
+            finally:
+                self.events.put(None)
+        from replay import Replay  # index it now, so replaying it opens instantly
+        Replay(self.record)
+
+    def close(self):
+        """Stop the simulation if the UI quits before it is over"""
+        if self.replay is not None:
+            self.replay_events.close()
+            return
+        if self.proc is None:
+            # in-process engine - the pickers and loaders are our own children
+            for child in mp.active_children():
+                child.terminate()
+            return
+        if self.proc.poll() is None:
+            if os.name == 'posix':
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            else:
+                self.proc.kill()
+        self.proc.wait()
     
     def process_next(self, event_delay):
         """Process the next event from raw output if enough time has passed"""
@@ -44,109 +152,160 @@ class EventProcessor:
         # Process one pending tree update if available
         # This creates a visual delay between when fruits are picked and when they disappear
         if self.pending_tree_updates and self.simulation_state.tree_fruits > 0:
+            pick_id, tree = self.pending_tree_updates.popleft()  # Remove the processed update
+            self.pending_picks.discard(pick_id)
             self.simulation_state.tree_fruits -= 1
-            self.pending_tree_updates.pop(0)  # Remove the processed update
+            self.simulation_state.tree_counts[tree] -= 1
             return True
             
         # Check if we've reached the end of events
-        if self.current_index >= len(self.raw_events):
+        if self.stream_ended:
             # Continue processing any remaining pending updates
             if self.pending_tree_updates:
                 return True
             return False
             
-        # Get and process the next event line
-        line = self.raw_events[self.current_index].strip()
+        # Get the next event, if main.py has not produced it yet try again next frame
+        try:
+            event = self._next_event()
+        except queue.Empty:
+            return True
+        if event is None:
+            self.stream_ended = True
+            return True
         self.current_index += 1
         
-        if not line:
-            return True  # Skip empty lines
-            
-        # Print the line for debugging
-        print(line)
-        
-        # Process the line and update simulation state
-        self._process_event_line(line)
+        # Process the event and update simulation state
+        self._process_event(event)
         
         # Update the last event time
         self.last_time = current_time
         
         # Stop when everyone's done and no pending updates
-        if all(s == 'exiting' for s in self.simulation_state.states.values()) and not self.pending_tree_updates:
+        if self.simulation_state.all_exited() and not self.pending_tree_updates:
             return False
             
         return True
         
-    def _process_event_line(self, line):
-        """Process a single event line and update the simulation state"""
+    def _next_event(self):
+        """Next event, None at the end of the stream. Raises queue.Empty if it has not arrived yet"""
+        if self.replay is not None:
+            return next(self.replay_events, (None, None))[0]
+        return self.events.get_nowait()
+
+    def apply(self, event):
+        """Process an event right away: no console echo, a picked fruit leaves its tree at once"""
+        self.current_index += 1
+        self._process_event(event, echo=False)
+        self._flush_tree_updates()
+
+    def _flush_tree_updates(self):
+        for _, tree in self.pending_tree_updates:
+            self.simulation_state.tree_fruits -= 1
+            self.simulation_state.tree_counts[tree] -= 1
+        self.pending_tree_updates.clear()
+        self.pending_picks.clear()
+
+    def advance(self, seconds=None, limit=None):
+        """
+        Unthrottled playback: apply events until `seconds` have passed, `limit` events were applied or
+        the next one has not arrived yet. Returns False once the run is over.
+        """
+        self._flush_tree_updates()
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        applied = 0
+        while not self.stream_ended and applied != limit:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            try:
+                event = self._next_event()
+            except queue.Empty:
+                break
+            if event is None:
+                self.stream_ended = True
+                break
+            self.apply(event)
+            applied += 1
+        self.last_time = time.time()
+        return not (self.stream_ended or self.simulation_state.all_exited())
+
+    def seek(self, index):
+        """
+        Jump to the state right after the index-th event of a replay (0 is the start):
+        restore the last checkpoint at or before it and apply the events in between, O(log n + k).
+        """
+        index = max(0, min(index, self.replay.count))
+        number, offset, snapshot, log = self.replay.checkpoint(index)
+        self.simulation_state.restore(snapshot)
+        self.log = list(log)
+        self.pending_tree_updates.clear()
+        self.pending_picks.clear()
+        self.current_index = number
+        if self.metrics is not None:
+            self.metrics.reset()
+
+        self.replay_events.close()
+        self.replay_events = self.replay.read(offset)
+        while self.current_index < index:
+            event, _ = next(self.replay_events)
+            self.apply(event)
+        self.stream_ended = False
+
+    def _process_event(self, event, echo=True):
+        """Process a single event record and update the simulation state"""
+        name = event.actor
+        state = format_state(event, self.simulation_state.tree_count)
+
         # Add to log with max size limit
+        line = f"{name}: {state}"
         self.log.append(line)
         if len(self.log) > MAX_LOG_LINES:
             self.log.pop(0)
             
-        # Parse the event line
-        cols = [c.strip() for c in line.split('|')]
-        if len(cols) == len(self.simulation_state.states):
-            # Update each actor's state
-            for name, state in zip(self.simulation_state.states.keys(), cols):
-                prev = self.simulation_state.states[name]
-                
-                # Only handle state transitions if state has actually changed
-                if state != prev:
-                    self.simulation_state.states[name] = state
-                    # Handle the state transition only if it's actually new
-                    self._handle_state_transition(name, prev, state)
+        # Print the line for debugging
+        if echo:
+            print(line)
+
+        self.simulation_state.set_state(name, state)
+        self._handle_event(event)
+        if self.metrics is not None:
+            self.metrics.feed(event)
     
-    def _handle_state_transition(self, name, prev_state, new_state):
-        """Handle special state transitions that affect simulation state"""
-        # Check for a real state transition to avoid duplicates
-        if name.startswith('Picker') and new_state.startswith('picked '):
-            # Only add to pending updates if this picker wasn't already in a picked state
-            if not prev_state.startswith('picked '):
-                # Extract the fruit information to avoid duplicating
-                fruit_info = new_state.split(' ', 1)[1]  # Get everything after "picked "
-                
-                # Add a unique identifier for this pick action to avoid duplicates
-                pick_id = f"{name}:{fruit_info}"
-                
-                # Check if this exact pick isn't already pending
-                if not any(update == pick_id for update in self.pending_tree_updates):
-                    # Add the pick identifier to the pending updates
-                    self.pending_tree_updates.append(pick_id)
-        
-        # Storing logic - parse "stored #X in Y" format
-        if name.startswith('Picker') and new_state.startswith('stored '):
-            self._handle_fruit_stored(new_state)
+    def _handle_event(self, event):
+        """Handle the events that affect simulation state beyond the actor's own state"""
+        name = event.actor
+
+        # Remember which tree a picker went to, its next picks come from there
+        if event.event in ('waiting tree', 'acquired tree'):
+            self.simulation_state.picker_trees[name] = event.tree
+
+        if event.event == 'picked':
+            # Add a unique identifier for this pick action to avoid duplicates
+            pick_id = (name, event.fruit)
             
-        # Loader empties crate → increment totals & reset crate count
-        if name == 'Loader' and new_state == 'emptied crate' and prev_state != new_state:
-            self._handle_crate_emptied()
+            # Check if this exact pick isn't already pending
+            if pick_id not in self.pending_picks:
+                # Add the pick identifier and its tree to the pending updates
+                self.pending_tree_updates.append((pick_id, event.tree))
+                self.pending_picks.add(pick_id)
+        
+        # Fruit goes into its crate slot
+        if event.event == 'stored':
+            self._handle_fruit_stored(event.fruit, event.slot, event.crate)
+
+        # Loader takes a crate → increment totals by its own fruit count (slot), whichever crate it is
+        if event.event in ('loading', 'partial'):
+            self.simulation_state.load_crate(name, event.slot)
+
+        # Loader empties crate → reset the slots if they show that crate
+        if event.event in ('emptied crate', 'partial'):
+            self._handle_crate_emptied(event.crate)
     
-    def _handle_fruit_stored(self, state):
+    def _handle_fruit_stored(self, fruit_number, slot_number, crate):
         """Handle a fruit being stored in a crate"""
-        try:
-            # Parse the stored message: "stored #8 in 3" format
-            parts = state.split()
-            if len(parts) >= 4:
-                fruit_number = int(parts[1].replace('#', ''))  # Extract fruit number
-                slot_number = int(parts[3])  # Extract slot number
-                
-                # Update crate count based on number of filled slots
-                # Instead of tracking max fruit ID, count the number of filled slots
-                self.simulation_state.crate_slots[slot_number-1] = fruit_number
-                
-                # Count non-zero slots to determine actual crate count
-                self.simulation_state.crate_count = sum(1 for slot in self.simulation_state.crate_slots if slot > 0)
-                
-        except (ValueError, IndexError) as e:
-            print(f"Error parsing store message: {state} - {str(e)}")
+        # crate_count counts the filled slots as they fill, no recount
+        self.simulation_state.store_fruit(slot_number, fruit_number, crate)
     
-    def _handle_crate_emptied(self):
-        """Handle the loader emptying a crate"""
-        # Add current crate count to loaded fruits
-        self.simulation_state.loaded_crates += 1
-        self.simulation_state.loaded_fruits += self.simulation_state.crate_count
-        self.simulation_state.crate_count = 0
-        # Reset all crate slots
-        for i in range(len(self.simulation_state.crate_slots)):
-            self.simulation_state.crate_slots[i] = 0
\ No newline at end of file
+    def _handle_crate_emptied(self, crate):
+        """Handle a loader emptying a crate"""
+        self.simulation_state.empty_crate(crate)
\ No newline at end of file
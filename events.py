@@ -0,0 +1,182 @@
+import json
+import struct
+from collections import namedtuple
+
+# Event types in code order, the binary format stores the index
+EVENT_TYPES = [
+    'idle',
+    'waiting tree', 'acquired tree', 'picked',
+    'waiting slot', 'got slot', 'waiting crate', 'acquired crate', 'stored', 'crate full',
+    'waiting full', 'got full', 'loading', 'emptied crate', 'reset slots', 'partial',
+    'exiting',
+]
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+EVENT_FORMATS = ('table', 'jsonl', 'binary')
+
+# One state transition of one actor.
+#   fruit - fruit id for picked/stored
+#   slot  - crate slot for stored, number of fruits for loading/partial
+#   crate - crate id for stored/crate full/got full/loading/emptied crate/partial
+#   tree  - tree id for waiting tree/acquired tree/picked
+#   fruits - fruit ids for loading/partial (jsonl only, the binary format drops them)
+Event = namedtuple('Event', 'seq ts actor event fruit slot crate tree fruits', defaults=((),))
+
+BINARY_MAGIC = b'ORCH'
+BINARY_HEADER = struct.Struct('<4sI')  # magic, length of the JSON meta that follows
+BINARY_RECORD = struct.Struct('<QdHBiiii')  # seq, ts, actor index, event code, fruit, slot, crate, tree
+# what an actor sends down its own event pipe, the pipe tells the actor and the merger assigns seq
+PIPE_RECORD = struct.Struct('<dBiiiiH')  # ts, event code, fruit, slot, crate, tree, number of fruit ids that follow
+
+
+def format_state(event, trees=1):
+    """
+    Human readable state of an event, as shown in the console table.
+    """
+    kind = event.event
+    if kind in ('waiting tree', 'acquired tree') and trees > 1:
+        return f'{kind} {event.tree + 1}'
+    if kind == 'picked':
+        return f'picked #{event.fruit}:{event.fruit}'
+    if kind == 'stored':
+        return f'stored #{event.fruit} in {event.slot}'
+    if kind in ('loading', 'partial'):
+        return f'{kind} {event.slot} {",".join(f"#{f}" for f in event.fruits)}'.rstrip()
+    return kind
+
+
+class JsonlWriter:
+    """
+    Writes a meta line, then one JSON object per event.
+    Only the header is flushed, whoever writes the events flushes them (the EventMerger once per batch).
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write_header(self, meta):
+        self.stream.write(json.dumps({'meta': meta}).encode() + b'\n')
+        self.stream.flush()
+
+    def write(self, event):
+        record = event._asdict()
+        if not record['fruits']:
+            del record['fruits']
+        self.stream.write(json.dumps(record).encode() + b'\n')
+
+
+class BinaryWriter:
+    """
+    Writes a magic + JSON meta header, then fixed-size records.
+    """
+    def __init__(self, stream, actors):
+        self.stream = stream
+        self.actor_ids = {name: i for i, name in enumerate(actors)}
+
+    def write_header(self, meta):
+        data = json.dumps(meta).encode()
+        self.stream.write(BINARY_HEADER.pack(BINARY_MAGIC, len(data)) + data)
+        self.stream.flush()
+
+    def write(self, event):
+        self.stream.write(BINARY_RECORD.pack(event.seq, event.ts, self.actor_ids[event.actor],
+                                             EVENT_CODES[event.event], event.fruit, event.slot,
+                                             event.crate, event.tree))
+
+
+def pack_record(ts, event, fruit=0, slot=0, crate=-1, tree=-1, fruits=()):
+    """
+    Compact pipe record of one event, the fruit ids follow as int32s.
+    """
+    data = PIPE_RECORD.pack(ts, EVENT_CODES[event], fruit, slot, crate, tree, len(fruits))
+    if fruits:
+        data += struct.pack(f'<{len(fruits)}i', *fruits)
+    return data
+
+
+def unpack_record(data):
+    """
+    Inverse of pack_record: (ts, event, fruit, slot, crate, tree, fruits).
+    """
+    ts, code, fruit, slot, crate, tree, count = PIPE_RECORD.unpack_from(data)
+    fruits = struct.unpack_from(f'<{count}i', data, PIPE_RECORD.size) if count else ()
+    return ts, EVENT_TYPES[code], fruit, slot, crate, tree, fruits
+
+
+def make_writer(fmt, stream, actors):
+    """
+    Writer for 'jsonl' or 'binary' on a binary stream.
+    """
+    if fmt == 'jsonl':
+        return JsonlWriter(stream)
+    if fmt == 'binary':
+        return BinaryWriter(stream, actors)
+    raise ValueError(f"unknown event format {fmt!r}")
+
+
+def read_events(stream):
+    """
+    Read the meta header from a binary stream of either format.
+    Returns (meta, iterator of Event).
+    """
+    magic = stream.read(len(BINARY_MAGIC))
+    if magic == BINARY_MAGIC:
+        (size,) = struct.unpack('<I', stream.read(4))
+        meta = json.loads(stream.read(size))
+        return meta, _read_binary(stream, meta['actors'])
+    first = json.loads(magic + stream.readline())
+    return first['meta'], _read_jsonl(stream)
+
+
+def _read_jsonl(stream):
+    # the complete lines that have arrived are decoded at once as one JSON array (thousands of them from
+    # a file, whatever main.py wrote so far from a pipe), the per-call overhead of json.loads costs more
+    # than the parsing itself. read1 returns what is there instead of waiting for the whole chunk.
+    decode = json.JSONDecoder().decode
+    rest = b''
+    while True:
+        data = stream.read1(1 << 20)
+        if not data:
+            data, rest = rest, b''  # (a last line without its newline)
+            if not data:
+                return
+        else:
+            data = rest + data
+            end = data.rfind(b'\n') + 1
+            data, rest = data[:end], data[end:]
+        lines = [line for line in data.split(b'\n') if line.strip()]
+        if not lines:
+            continue
+        for r in decode('[' + b','.join(lines).decode() + ']'):
+            yield jsonl_event(r)
+
+
+def jsonl_event(r):
+    """
+    Event from one decoded jsonl record.
+    """
+    return Event(r['seq'], r['ts'], r['actor'], r['event'], r['fruit'], r['slot'], r['crate'], r['tree'],
+                 tuple(r.get('fruits', ())))
+
+
+def _read_binary(stream, actors):
+    size = BINARY_RECORD.size
+    chunk = size * 4096
+    rest = b''
+    while True:
+        data = stream.read1(chunk)  # (what has arrived, up to chunk)
+        if not data:
+            return  # a record cut off at the end is dropped
+        data = rest + data
+        end = len(data) - len(data) % size
+        # keep a partial record for the next read
+        data, rest = data[:end], data[end:]
+        if data:
+            yield from binary_events(data, actors)
+
+
+def binary_events(data, actors):
+    """
+    Events of a whole number of binary records.
+    """
+    for seq, ts, actor, code, fruit, slot, crate, tree in BINARY_RECORD.iter_unpack(data):
+        yield Event(seq, ts, actors[actor], EVENT_TYPES[code], fruit, slot, crate, tree)
@@ -0,0 +1,78 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+EXPORT_FORMATS = ('png', 'raw')
+EXPORT_QUEUE_SIZE = 32  # frames waiting for the writer before rendering has to wait too
+PNG_LEVEL = 3  # zlib level, higher is smaller and slower
+
+
+def png_bytes(data, width, height, level=PNG_LEVEL):
+    """
+    PNG file contents of rgb24 pixel data. Most of the time goes into zlib, which lets go of the GIL,
+    so encoding on the writer thread runs alongside the renderer.
+    """
+    stride = width * 3
+    rows = b''.join(b'\x00' + data[y * stride:(y + 1) * stride] for y in range(height))  # filter 0 per row
+
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, level))
+            + chunk(b'IEND', b''))
+
+
+class FrameWriter:
+    """
+    Writes rendered frames on a background thread, as a PNG sequence in a directory
+    (frame_000000.png, ..) or as one raw rgb24 stream, frames back to back.
+    The hand-off queue is bounded, so a slow disk makes rendering wait instead of piling up frames.
+    """
+    def __init__(self, path, size, fmt='png'):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"unknown export format {fmt!r}")
+        self.path = path
+        self.size = size
+        self.fmt = fmt
+        self.count = 0
+        self.error = None
+        if fmt == 'png':
+            os.makedirs(path, exist_ok=True)
+            self.stream = None
+        else:
+            self.stream = open(path, 'wb')
+        self.frames = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        """Queue one frame of rgb24 bytes"""
+        self.frames.put((self.count, data))
+        self.count += 1
+
+    def _run(self):
+        width, height = self.size
+        for index, data in iter(self.frames.get, None):
+            if self.error is not None:
+                continue  # keep taking frames so write() never blocks, close() reports the error
+            try:
+                if self.stream is not None:
+                    self.stream.write(data)
+                else:
+                    with open(os.path.join(self.path, f"frame_{index:06d}.png"), 'wb') as f:
+                        f.write(png_bytes(data, width, height))
+            except OSError as e:
+                self.error = e
+
+    def close(self):
+        """Wait for the queued frames to be written"""
+        self.frames.put(None)
+        self.thread.join()
+        if self.stream is not None:
+            self.stream.close()
+        if self.error is not None:
+            raise self.error
@@ -1,42 +1,180 @@
 import argparse
+import sys
 from multiprocessing import set_start_method
 import multiprocessing as mp
 from util import *
+from contention import Contention
+from virtual_engine import VirtualOrchard
 
+ENGINES = ('process', 'virtual')
 
-def run_orchard(num_fruits, num_pickers, crate_capacity):
+
+def run_orchard(num_fruits, num_pickers, crate_capacity, backend='manager', batch=1, num_crates=1, load_delay=0.0,
+                num_loaders=1, num_trees=1, events='table', event_queue=None, engine='process', pick_time=0.001,
+                store_time=0.001, seed=None, output='full', every=100, interval=None, contention=False,
+                contention_json=None):
+    """
+    Run the orchard to completion. With an event_queue the Event records are put there
+    (followed by None once everyone exited) and nothing is printed.
+    output picks how much of the table is printed (see util.event_sink), 'none' skips events altogether.
+    contention times every lock, semaphore and queue per actor and prints a report to stderr at the end,
+    contention_json also dumps it to that file (process engine only).
+    The virtual engine runs the same protocol in virtual time (virtual_engine.py), pick_time and store_time
+    only apply to it (load_delay is real seconds for the process engine). seed makes a virtual run repeatable,
+    for the process engine it only fixes which fruits get picked.
+    """
 
     ## just the printing stuff
-    process_names = [f"Picker-{i}" for i in range(1, num_pickers + 1)] + ["Loader"]
+    # a single loader keeps its old name, several are Loader-1 .. Loader-M
+    loader_ids = [None] if num_loaders == 1 else list(range(1, num_loaders + 1))
+    process_names = [f"Picker-{i}" for i in range(1, num_pickers + 1)]
+    process_names += ["Loader" if i is None else f"Loader-{i}" for i in loader_ids]
     header_line = " | ".join(f"{name:^15}" for name in process_names)
     separator = "-" * len(header_line)
 
-    resources = SharedResources(num_fruits, crate_capacity, process_names, header_line, separator)
+    # (an event queue gets no header, its reader already knows the run parameters)
+    if event_queue is not None or output in ('summary', 'none'):
+        pass
+    elif events == 'table':
+        # several trees get a line of their own above the table
+        if num_trees > 1:
+            print(f"Orchard: {num_trees} trees | " +
+                  " | ".join(f"tree {t + 1}: {len(tree_fruit_ids(num_fruits, num_trees, t))}"
+                             for t in range(num_trees)))
+        print(header_line)
+        print(separator, flush=True)
+    else:
+        # event streams start with the run parameters instead
+        meta = {'fruits': num_fruits, 'pickers': num_pickers, 'capacity': crate_capacity, 'crates': num_crates,
+                'loaders': num_loaders, 'trees': num_trees, 'batch': batch, 'backend': backend,
+                'engine': engine, 'actors': process_names}
+        make_writer(events, sys.stdout.buffer, process_names).write_header(meta)
+        sys.stdout.buffer.flush()
+
+    if event_queue is not None:
+        output = 'full'
+    sink_options = dict(events=events, process_names=process_names, separator=separator, num_trees=num_trees,
+                        event_queue=event_queue, output=output, every=every, interval=interval,
+                        num_fruits=num_fruits, num_crates=num_crates)
+
+    if engine == 'virtual':
+        sink = event_sink(**sink_options) if output != 'none' else None
+        VirtualOrchard(num_fruits, num_pickers, crate_capacity, batch, num_crates, num_loaders, num_trees,
+                       pick_time, store_time, load_delay, seed, sink).run()
+        if event_queue is not None:
+            event_queue.put(None)
+        return
 
-    print(header_line)
-    print(separator)
+    stats = Contention(process_names, primitive_names(num_trees)) if contention or contention_json else None
+    resources = SharedResources(num_fruits, crate_capacity, backend, num_crates, num_trees, stats, seed)
 
-    loader = Loader(resources)
-    pickers = [Picker(i, resources) for i in range(1, num_pickers + 1)]
+    # one event pipe per actor (receiving end, sending end), only the merger reads them,
+    # and one idle flag per actor telling the merger who is blocked
+    if output != 'none':
+        pipes = {name: mp.Pipe(duplex=False) for name in process_names}
+        idle = mp.RawArray('b', len(process_names))
+        merger = EventMerger({name: pipe[0] for name, pipe in pipes.items()}, sink_options,
+                             [pipe[1] for pipe in pipes.values()], idle)
+    else:
+        pipes = {name: (None, None) for name in process_names}
+        idle = None
+        merger = None
+    flags = [IdleFlag(idle, i) for i in range(len(process_names))]
+    pickers = [Picker(i, resources, pipes[name][1], batch, flags[i - 1])
+               for i, name in enumerate(process_names[:num_pickers], 1)]
+    loaders = [Loader(resources, pipes[name][1], load_delay, i, flags[num_pickers + j])
+               for j, (i, name) in enumerate(zip(loader_ids, process_names[num_pickers:]))]
 
 
     ## start everything
-    loader.start()
+    if merger is not None:
+        merger.start()
+    for l in loaders:
+        l.start()
     for p in pickers:
         p.start()
+    # the children have their ends now, the merger sees a pipe close once its actor exits
+    if merger is not None:
+        for receiving, sending in pipes.values():
+            receiving.close()
+            sending.close()
     for p in pickers:
         p.join()
 
-    resources.done.value = True
-    resources.full_crate_sem.release()
-    loader.join()
+    # no more full crates are coming, wake every loader up - the first one reports the partial crate
+    for l in loaders:
+        resources.full_crates.put(None)
+    for l in loaders:
+        l.join()
+    if merger is not None:
+        merger.join()
+
+    if stats is not None:
+        stats.print_report()
+        if contention_json:
+            stats.dump(contention_json)
+
+    if event_queue is not None:
+        event_queue.put(None)
 
 
 if __name__ == "__main__":
-    set_start_method('spawn') 
     parser = argparse.ArgumentParser()
     parser.add_argument("--fruits", "-f", type=int, default=26)
     parser.add_argument("--pickers", "-p", type=int, default=3)
     parser.add_argument("--capacity", "-c", type=int, default=12)
+    parser.add_argument("--backend", "-b", choices=BACKENDS, default="manager")
+    parser.add_argument("--batch", "-k", type=int, default=1)
+    parser.add_argument("--crates", "-n", type=int, default=1)
+    parser.add_argument("--loaders", "-l", type=int, default=1)
+    parser.add_argument("--trees", "-t", type=int, default=1)
+    parser.add_argument("--events", "-e", choices=EVENT_FORMATS, default="table",
+                        help="table for people, jsonl or binary records (events.py) for programs")
+    parser.add_argument("--output", "-o", choices=OUTPUTS, default="full",
+                        help="full prints every event, sampled every Nth table row, summary periodic totals and a "
+                             "final report, none nothing at all")
+    parser.add_argument("--every", type=int, default=100,
+                        help="print every Nth table row with --output sampled")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="seconds between rows with --output sampled (instead of --every) "
+                             "or between summary lines (default: 1)")
+    parser.add_argument("--contention", action="store_true",
+                        help="time every lock, semaphore and queue per actor, report to stderr at exit")
+    parser.add_argument("--contention-json", metavar="FILE",
+                        help="also dump the contention histograms to FILE (implies --contention)")
+    parser.add_argument("--load-delay", type=float, default=0.0,
+                        help="seconds the loader spends loading each crate (virtual seconds with --engine virtual)")
+    parser.add_argument("--engine", choices=ENGINES, default="process",
+                        help="process runs real processes, virtual replays them on an event scheduler in virtual time")
+    parser.add_argument("--pick-time", type=float, default=0.001,
+                        help="virtual seconds a pick takes (virtual engine only)")
+    parser.add_argument("--store-time", type=float, default=0.001,
+                        help="virtual seconds storing a fruit takes (virtual engine only)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed, repeats a virtual run exactly and the fruit picks of a process run")
+    parser.add_argument("--start-method", choices=mp.get_all_start_methods(), default="spawn",
+                        help="how the worker processes are started (default: spawn)")
     args = parser.parse_args()
-    run_orchard(args.fruits, args.pickers, args.capacity)
\ No newline at end of file
+    set_start_method(args.start_method)
+    if args.batch < 1:
+        parser.error("--batch must be at least 1")
+    if args.crates < 1:
+        parser.error("--crates must be at least 1")
+    if args.loaders < 1:
+        parser.error("--loaders must be at least 1")
+    if args.trees < 1:
+        parser.error("--trees must be at least 1")
+    if args.every < 1:
+        parser.error("--every must be at least 1")
+    if args.interval is not None and args.interval <= 0:
+        parser.error("--interval must be positive")
+    if args.output in ('sampled', 'summary') and args.events != 'table':
+        parser.error(f"--output {args.output} prints text, it only works with --events table")
+    if args.engine == 'virtual' and (args.contention or args.contention_json):
+        parser.error("--contention times real locks, it needs --engine process")
+    if min(args.load_delay, args.pick_time, args.store_time) < 0:
+        parser.error("--load-delay, --pick-time and --store-time must not be negative")
+    run_orchard(args.fruits, args.pickers, args.capacity, args.backend, args.batch, args.crates, args.load_delay,
+                args.loaders, args.trees, args.events, engine=args.engine, pick_time=args.pick_time,
+                store_time=args.store_time, seed=args.seed, output=args.output, every=args.every,
+                interval=args.interval, contention=args.contention, contention_json=args.contention_json)
\ No newline at end of file
@@ -0,0 +1,130 @@
+from collections import deque
+from config import METRICS_SAMPLE, METRICS_WINDOW, SPARKLINE_POINTS
+
+PICKER_WAITS = ('waiting tree', 'waiting slot', 'waiting crate')
+# what a picker waiting there is short of
+WAIT_CAUSES = {'waiting tree': 'tree locks', 'waiting slot': 'free crate slots', 'waiting crate': 'the crate lock'}
+# the values that keep a history for the sparklines
+SERIES = ('fruits/s', 'crate fill', 'loaders busy', 'pickers working')
+
+
+class Metrics:
+    """
+    Throughput and utilization of a run, computed from its events as they are applied. Time is the events'
+    own timestamps, so a replay shows the numbers of the recorded run at any playback speed.
+    Events are taken in samples of METRICS_SAMPLE (at least one per actor, so closing a sample stays O(1)
+    per event), rates and ratios cover the last METRICS_WINDOW samples and every value in SERIES keeps
+    SPARKLINE_POINTS samples of history.
+    """
+    def __init__(self, pickers, loaders):
+        self.picker_ids = {name: i for i, name in enumerate(pickers)}
+        self.loaders = set(loaders)
+        self.sample_size = max(METRICS_SAMPLE, len(pickers) + len(loaders))
+        self.version = 0  # bumped every sample and reset, the panel only changes then
+        self.reset()
+
+    def reset(self):
+        """Start over, after a seek the history no longer lines up"""
+        self.current = {}  # actor -> (its latest event, ts it happened)
+        self.crate_started = {}  # crate id -> ts of its first stored fruit
+        # per picker seconds working and seconds seen, decayed every sample so old samples fade out
+        self.work = [0.0] * len(self.picker_ids)
+        self.seen = [0.0] * len(self.picker_ids)
+        self.utilization = []  # per picker share of its recent time spent working, as of the last sample
+        self.samples = deque(maxlen=METRICS_WINDOW)
+        self.history = {key: deque(maxlen=SPARKLINE_POINTS) for key in SERIES}
+        self.latest = None  # the window values after the last sample, None before the first one
+        self.version += 1
+        self.sample = self._new_sample(None)
+
+    @staticmethod
+    def _new_sample(start):
+        sample = {'start': start, 'end': start, 'events': 0, 'stored': 0, 'fills': 0, 'fill time': 0.0,
+                  'idle': 0.0, 'busy': 0.0, 'work': 0.0}
+        sample.update((kind, 0.0) for kind in PICKER_WAITS)
+        return sample
+
+    def _account(self, actor, kind, seconds):
+        """Book the seconds an actor spent after an event of kind"""
+        if kind == 'exiting':
+            return
+        picker = self.picker_ids.get(actor)
+        if picker is not None:
+            category = kind if kind in PICKER_WAITS else 'work'
+            self.sample[category] += seconds
+            self.seen[picker] += seconds
+            if category == 'work':
+                self.work[picker] += seconds
+        elif actor in self.loaders:
+            self.sample['idle' if kind == 'waiting full' else 'busy'] += seconds
+
+    def feed(self, event):
+        kind, ts = event.event, event.ts
+        sample = self.sample
+        if sample['start'] is None:
+            sample['start'] = ts
+        previous = self.current.get(event.actor)
+        if previous is not None:
+            self._account(event.actor, previous[0], ts - previous[1])
+        self.current[event.actor] = (kind, ts)
+
+        if kind == 'stored':
+            sample['stored'] += 1
+            if event.slot == 1:
+                self.crate_started[event.crate] = ts
+        elif kind == 'crate full':
+            start = self.crate_started.pop(event.crate, None)
+            if start is not None:
+                sample['fills'] += 1
+                sample['fill time'] += ts - start
+        sample['events'] += 1
+        if sample['events'] >= self.sample_size:
+            self._close(ts)
+
+    def _close(self, ts):
+        """End the sample at ts: book everyone's time up to it, update the window values and the history"""
+        for actor, (kind, since) in self.current.items():
+            self._account(actor, kind, ts - since)
+            self.current[actor] = (kind, ts)
+        self.sample['end'] = ts
+        self.samples.append(self.sample)
+        self.utilization = [w / s if s else 0.0 for w, s in zip(self.work, self.seen)]
+        decay = 1 - 1 / METRICS_WINDOW
+        self.work = [w * decay for w in self.work]
+        self.seen = [s * decay for s in self.seen]
+
+        self.latest = self._window()
+        for key in SERIES:
+            self.history[key].append(self.latest[key])
+        self.version += 1
+        self.sample = self._new_sample(ts)
+
+    def _window(self):
+        total = {key: sum(sample[key] for sample in self.samples) for key in self.sample}
+        elapsed = sum(sample['end'] - sample['start'] for sample in self.samples)
+        waited = sum(total[kind] for kind in PICKER_WAITS)
+        picker_time = total['work'] + waited
+        loader_time = total['idle'] + total['busy']
+        fill = self.history['crate fill']
+        values = {
+            'fruits/s': total['stored'] / elapsed if elapsed else 0.0,
+            # (no crate filled in the window, keep showing the last fill time)
+            'crate fill': total['fill time'] / total['fills'] if total['fills'] else (fill[-1] if fill else 0.0),
+            'loaders busy': total['busy'] / loader_time if loader_time else 0.0,
+            'pickers working': total['work'] / picker_time if picker_time else 0.0,
+        }
+        values.update((kind, total[kind] / picker_time if picker_time else 0.0) for kind in PICKER_WAITS)
+        return values
+
+    def bottleneck(self):
+        """Where the pickers lose the most time, as a line for the panel"""
+        if self.latest is None:
+            return "collecting..."
+        kind = max(PICKER_WAITS, key=self.latest.get)
+        if self.latest[kind] < 0.1:
+            return "no bottleneck, pickers mostly working"
+        line = f"bottleneck: {WAIT_CAUSES[kind]} ({self.latest[kind]:.0%} waiting)"
+        if kind == 'waiting slot':
+            # (tells whether the loaders are the ones behind)
+            line += f", loaders {self.latest['loaders busy']:.0%} busy"
+        return line
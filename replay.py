@@ -0,0 +1,137 @@
+import argparse
+import bisect
+import json
+import os
+import struct
+import zlib
+from events import read_events, jsonl_event, binary_events, BINARY_MAGIC, BINARY_RECORD
+
+CHECKPOINT_EVERY = 500  # events between two checkpoints (at least), the most a seek has to apply
+CHECKPOINT_PER_ACTOR = 4  # more events than this per actor between two checkpoints, a snapshot grows with the actors
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 3
+INDEX_TRAILER = struct.Struct('<Q')  # offset of the JSON table at the end of the index file
+
+
+class Replay:
+    """
+    A recorded event log (jsonl or binary, as main.py --events and ui.py --record write them) and its
+    sidecar index FILE.idx: the byte offset of every checkpoint_every(meta)-th event, each with a snapshot of
+    the UI state right before it. The index is built on first use and rebuilt when the log changed size.
+    The index file holds the snapshots compressed one after another, then a JSON table of the checkpoints
+    (event number, log offset, where its snapshot is) - opening reads only the table, a snapshot is read
+    when a seek needs it.
+    """
+    def __init__(self, path, every=None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+            f.seek(0)
+            self.meta, _ = read_events(f)
+            self.start = f.tell()  # offset of the first event
+
+        self.index_path = path + INDEX_SUFFIX
+        index = self._load_index()
+        if index is None:
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                index = build_index(self, f, every or checkpoint_every(self.meta))
+            os.replace(tmp, self.index_path)
+        self.count = index['events']
+        self.checkpoints = index['checkpoints']  # [event number, offset, snapshot start, snapshot size]
+        self.numbers = [c[0] for c in self.checkpoints]
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                f.seek(-INDEX_TRAILER.size, os.SEEK_END)
+                (table,) = INDEX_TRAILER.unpack(f.read(INDEX_TRAILER.size))
+                f.seek(table)
+                index = json.loads(f.read()[:-INDEX_TRAILER.size])
+        except (OSError, ValueError, struct.error):
+            return None
+        if index.get('version') != INDEX_VERSION or index.get('size') != os.path.getsize(self.path):
+            return None
+        return index
+
+    def checkpoint_number(self, index):
+        """Event number of the last checkpoint at or before event number index"""
+        return self.numbers[bisect.bisect_right(self.numbers, index) - 1]
+
+    def checkpoint(self, index):
+        """The last checkpoint at or before event number index: (event number, offset, state snapshot, log lines)"""
+        number, offset, start, size = self.checkpoints[bisect.bisect_right(self.numbers, index) - 1]
+        with open(self.index_path, 'rb') as f:
+            f.seek(start)
+            snapshot, log = json.loads(zlib.decompress(f.read(size)))
+        return number, offset, snapshot, log
+
+    def read(self, offset):
+        """(event, offset right after it) for every event from byte offset on"""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            if self.binary:
+                size = BINARY_RECORD.size
+                while True:
+                    data = f.read(size * 256)
+                    data = data[:len(data) - len(data) % size]  # (a log cut off mid-record)
+                    if not data:
+                        return
+                    for event in binary_events(data, self.meta['actors']):
+                        offset += size
+                        yield event, offset
+            else:
+                for line in f:
+                    offset += len(line)
+                    if line.strip():
+                        yield jsonl_event(json.loads(line)), offset
+
+
+def checkpoint_every(meta):
+    """Events between two checkpoints of a log, more with more actors so the index stays O(events)"""
+    return max(CHECKPOINT_EVERY, CHECKPOINT_PER_ACTOR * len(meta['actors']))
+
+
+def build_index(replay, f, every=CHECKPOINT_EVERY):
+    """Apply the whole log once, writing a checkpoint every `every` events to the index file f"""
+    # the UI modules need pygame, plain main.py runs never get here
+    from event_processor import EventProcessor
+    from simulation_state import SimulationState
+
+    meta = replay.meta
+    state = SimulationState(meta['fruits'], meta['pickers'], meta['capacity'],
+                            meta.get('loaders', 1), meta.get('trees', 1))
+    processor = EventProcessor(meta['fruits'], meta['pickers'], meta['capacity'], state,
+                               meta.get('loaders', 1), meta.get('trees', 1), engine=None)
+    checkpoints = []
+
+    def checkpoint(offset):
+        data = zlib.compress(json.dumps([state.snapshot(), processor.log]).encode())
+        checkpoints.append([processor.current_index, offset, f.tell(), len(data)])
+        f.write(data)
+
+    checkpoint(replay.start)
+    for event, offset in replay.read(replay.start):
+        processor.apply(event)
+        if processor.current_index % every == 0:
+            checkpoint(offset)
+    index = {'version': INDEX_VERSION, 'size': os.path.getsize(replay.path), 'events': processor.current_index,
+             'every': every, 'checkpoints': checkpoints}
+    table = f.tell()
+    f.write(json.dumps(index).encode())
+    f.write(INDEX_TRAILER.pack(table))
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the seek index of a recorded event log for ui.py --replay")
+    parser.add_argument("log", help="jsonl or binary event log")
+    parser.add_argument("--every", type=int, default=None,
+                        help=f"events between two checkpoints (default: {CHECKPOINT_EVERY}, or "
+                             f"{CHECKPOINT_PER_ACTOR} per actor if that is more)")
+    args = parser.parse_args()
+
+    if os.path.exists(args.log + INDEX_SUFFIX):
+        os.remove(args.log + INDEX_SUFFIX)  # asked for explicitly, so always rebuild
+    replay = Replay(args.log, args.every)
+    print(f"{replay.count} events, {len(replay.checkpoints)} checkpoints -> {replay.index_path}")
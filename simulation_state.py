@@ -1,85 +1,233 @@
+import copy
 import math
 import random
+from array import array
 import pygame
-from config import TREE_POS, TREE_RADIUS, FRUIT_Y_OFFSET, CRATE_RECT, PADDING
+try:
+    import numpy as np
+except ImportError:  # optional, the array module holds the same positions, only built slower
+    np = None
+from config import (TREE_POS, TREE_RADIUS, FRUIT_Y_OFFSET, CRATE_RECT, TRUCK_RECT, TRUCK_AREA_LEFT, PADDING,
+                    TIMELINE_RECT, PICKER_DOT_SPACING)
+
+# everything the events change, what a replay checkpoint saves (positions only depend on the parameters)
+SNAPSHOT_FIELDS = ('tree_fruits', 'tree_counts', 'crate_count', 'crate_slots', 'crate_id', 'loaded_crates',
+                   'loaded_fruits', 'states', 'truck_loads', 'picker_trees')
+
 
 class SimulationState:
     """Manages the simulation state including positions and counters"""
     
-    def __init__(self, fruits, pickers, capacity):
+    def __init__(self, fruits, pickers, capacity, loaders=1, trees=1):
         self.total_fruits = fruits
         self.capacity = capacity
         self.picker_count = pickers
+        self.loader_count = loaders
+        self.tree_count = trees
 
         # Simulation state
         self.tree_fruits = fruits
+        # fruits are dealt round robin over the trees (same as main.py)
+        self.tree_counts = [len(range(t + 1, fruits + 1, trees)) for t in range(trees)]
         self.crate_count = 0
         self.loaded_crates = 0
         self.loaded_fruits = 0           
-        self.states = {f"Picker-{i}": 'idle' for i in range(1, pickers+1)}
-        self.states['Loader'] = 'idle'
+        self.picker_names = [f"Picker-{i}" for i in range(1, pickers+1)]
+        # a single loader keeps its old name, several are Loader-1 .. Loader-M (same as main.py)
+        self.loader_names = ['Loader'] if loaders == 1 else [f"Loader-{i}" for i in range(1, loaders+1)]
+        self.states = {name: 'idle' for name in self.picker_names + self.loader_names}
+        self.exiting = 0  # actors whose state is 'exiting', the run is over when it is all of them
+        self.truck_loads = {name: 0 for name in self.loader_names}  # crates delivered per truck
+        self.picker_trees = {name: 0 for name in self.picker_names}  # tree each picker last went to
         
-        # Initialize crate slots for tracking
+        # Initialize crate slots for tracking, crate_count is how many of them are filled
         self.crate_slots = [0] * capacity
+        self.crate_id = None  # crate the slots belong to, with several crates (main.py -n) it changes as they fill
+        self.crate_version = 0  # bumped whenever the crate changes, what the renderer compares
         
         # Calculate positions
         self._initialize_positions()
     
+    def snapshot(self):
+        """Copy of the counters and actor states, plain lists and dicts so it can go into JSON"""
+        return copy.deepcopy({field: getattr(self, field) for field in SNAPSHOT_FIELDS})
+
+    def restore(self, snapshot):
+        """Go back to a snapshot"""
+        for field, value in copy.deepcopy(snapshot).items():
+            setattr(self, field, value)
+        # (the counters derived from the snapshot fields are not saved in it)
+        self.exiting = sum(state == 'exiting' for state in self.states.values())
+        self.crate_version += 1
+
+    def set_state(self, name, state):
+        """Change an actor's state, keeping count of the exited actors"""
+        self.exiting += (state == 'exiting') - (self.states[name] == 'exiting')
+        self.states[name] = state
+
+    def all_exited(self):
+        return self.exiting == len(self.states)
+
+    def store_fruit(self, slot, fruit, crate=0):
+        """Put a fruit in a crate slot (1-based), a different crate id starts over with empty slots"""
+        if crate != self.crate_id:
+            # (the last one went to the loaders full, it is counted when they load it)
+            self._clear_crate()
+            self.crate_id = crate
+        if not self.crate_slots[slot - 1]:
+            self.crate_count += 1
+        self.crate_slots[slot - 1] = fruit
+        self.crate_version += 1
+
+    def load_crate(self, loader, fruits):
+        """A loader took a crate with that many fruits (full, or the partial one at the end)"""
+        self.loaded_crates += 1
+        self.truck_loads[loader] += 1
+        self.loaded_fruits += fruits
+        self.crate_version += 1
+
+    def empty_crate(self, crate):
+        """The crate is empty again, its slots are free if it is the one shown"""
+        if crate == self.crate_id:
+            self._clear_crate()
+            self.crate_version += 1
+
+    def _clear_crate(self):
+        self.crate_count = 0
+        self.crate_slots = [0] * self.capacity
+
     def _initialize_positions(self):
         """Initialize all positions for simulation elements"""
-        # Fruit positions
-        random.seed(0)  # Fixed seed for reproducibility
-        self.fruit_positions = self._generate_fruit_positions()
+        # Tree centers and radii
+        self.tree_layout = self._generate_tree_layout()
+
+        # Fruit positions, whole pixels in one x and one y buffer per tree (the remaining fruits of a
+        # tree are always the first tree_counts[tree] of them)
+        self.fruit_x, self.fruit_y = self._generate_fruit_positions()
         
         # Crate slot positions
-        self.crate_positions = self._generate_crate_positions()
+        self.crate_x, self.crate_y = self._generate_crate_positions()
         
+        # One truck per loader
+        self.truck_rects = self._generate_truck_rects()
+
         # Initial human positions
         self.initial_positions = self._generate_initial_positions()
+
+        # Where grouped pickers (more than PICKER_LOD_THRESHOLD) put their dots, per location
+        self.group_areas = self._generate_group_areas()
+        self.group_dots = {location: self._generate_group_dots(area) for location, area in self.group_areas.items()}
     
+    def _generate_tree_layout(self):
+        """Generate (center, radius) for each tree, several trees share the space of one in a row"""
+        if self.tree_count == 1:
+            return [(TREE_POS, TREE_RADIUS)]
+        width = (CRATE_RECT.x - 40) / self.tree_count
+        radius = min(TREE_RADIUS, width * 0.55)
+        y = TREE_POS.y + (TREE_RADIUS - radius) * 0.5
+        return [(pygame.math.Vector2(20 + width * (t + 0.5), y), radius) for t in range(self.tree_count)]
+
     def _generate_fruit_positions(self):
-        """Generate positions for fruits on the tree"""
-        positions = []
-        for _ in range(self.total_fruits):
-            angle = random.uniform(0, 2 * math.pi)
-            r = random.uniform(20, TREE_RADIUS * 0.5)
-            x = TREE_POS.x + math.cos(angle) * r
-            y = TREE_POS.y + math.sin(angle) * r - FRUIT_Y_OFFSET
-            positions.append(pygame.math.Vector2(x, y))
-        return positions
+        """Generate positions for fruits on the trees, int16 x and y buffers per tree (fixed seed)"""
+        xs, ys = [], []
+        rng = np.random.default_rng(0) if np is not None else random.Random(0)
+        for (center, radius), count in zip(self.tree_layout, self.tree_counts):
+            scale = radius / TREE_RADIUS
+            if np is not None:
+                angle = rng.uniform(0, 2 * math.pi, count)
+                r = rng.uniform(20 * scale, radius * 0.5, count)
+                xs.append((center.x + np.cos(angle) * r).astype(np.int16))
+                ys.append((center.y + np.sin(angle) * r - FRUIT_Y_OFFSET * scale).astype(np.int16))
+                continue
+            tree_x, tree_y = array('h'), array('h')
+            for _ in range(count):
+                angle = rng.uniform(0, 2 * math.pi)
+                r = rng.uniform(20 * scale, radius * 0.5)
+                tree_x.append(int(center.x + math.cos(angle) * r))
+                tree_y.append(int(center.y + math.sin(angle) * r - FRUIT_Y_OFFSET * scale))
+            xs.append(tree_x)
+            ys.append(tree_y)
+        return xs, ys
     
     def _generate_crate_positions(self):
-        """Generate positions for crate slots"""
-        positions = []
+        """Generate positions for crate slots, x and y buffers"""
         cols, rows = 4, math.ceil(self.capacity / 4)
-        for i in range(self.capacity):
-            col = i % cols
-            row = i // cols
-            x = CRATE_RECT.x + 10 + col * (CRATE_RECT.width - 20) / (cols - 1)
-            y = CRATE_RECT.y + 10 + row * (CRATE_RECT.height - 20) / (rows - 1)
-            positions.append(pygame.math.Vector2(x, y))
-        return positions
+        dx = (CRATE_RECT.width - 20) / (cols - 1)
+        dy = (CRATE_RECT.height - 20) / max(1, rows - 1)  # (a single row used to divide by zero)
+        xs = array('d', (CRATE_RECT.x + 10 + (i % cols) * dx for i in range(self.capacity)))
+        ys = array('d', (CRATE_RECT.y + 10 + (i // cols) * dy for i in range(self.capacity)))
+        return xs, ys
+
+    def crate_position(self, slot):
+        """Center of a crate slot (0-based)"""
+        return pygame.math.Vector2(self.crate_x[slot], self.crate_y[slot])
     
+    def _generate_truck_rects(self):
+        """Generate truck rectangles, extra trucks park to the left of the first one"""
+        # squeeze the trucks together instead of running into the header
+        step = min(TRUCK_RECT.width + 10, (TRUCK_RECT.right - TRUCK_AREA_LEFT) // self.loader_count)
+        return {name: TRUCK_RECT.move(-idx * step, 0) for idx, name in enumerate(self.loader_names)}
+
     def _generate_initial_positions(self):
-        """Generate initial positions for pickers and loader"""
+        """Generate initial positions for pickers and loaders"""
         positions = {}
-        for idx, name in enumerate(list(self.states.keys())[:-1]):
+        for idx, name in enumerate(self.picker_names):
             positions[name] = pygame.math.Vector2(PADDING + 20, 120 + idx * 50)
-        positions['Loader'] = pygame.math.Vector2(CRATE_RECT.centerx, CRATE_RECT.centery - 220)
+        for name in self.loader_names:
+            offset = self.truck_rects[name].x - TRUCK_RECT.x
+            positions[name] = pygame.math.Vector2(CRATE_RECT.centerx + offset, CRATE_RECT.centery - 220)
         return positions
     
+    def _generate_group_areas(self):
+        """Dot grid of each picker location: over every tree's crown, under the crate, at home top left"""
+        areas = {}
+        for tree, (center, radius) in enumerate(self.tree_layout):
+            area = pygame.Rect(0, 0, radius, radius * 0.5)
+            area.center = (int(center.x), int(center.y))
+            areas[f'tree {tree}'] = area
+        crate_top = CRATE_RECT.bottom + 30
+        areas['crate'] = pygame.Rect(CRATE_RECT.x - 20, crate_top, CRATE_RECT.width + 90,
+                                     TIMELINE_RECT.y - 24 - crate_top)
+        areas['home'] = pygame.Rect(PADDING + 10, 110, 180, 230)
+        return areas
+
+    def picker_location(self, name, state):
+        """Where a picker is when pickers are grouped: 'tree N', 'crate' or 'home' (as in get_picker_position)"""
+        if 'tree' in state or state.startswith('picked '):
+            return f'tree {self.picker_trees[name]}'
+        if 'crate' in state or state.startswith('stored '):
+            return 'crate'
+        return 'home'
+
+    def _generate_group_dots(self, area):
+        """Dot centers filling an area row by row, as many as fit"""
+        half = PICKER_DOT_SPACING // 2
+        return [(x + half, y + half) for y in range(area.y, area.bottom - PICKER_DOT_SPACING + 1, PICKER_DOT_SPACING)
+                for x in range(area.x, area.right - PICKER_DOT_SPACING + 1, PICKER_DOT_SPACING)]
+
+    def group_dot_at(self, location, pos):
+        """Index of the dot of a location's grid under pos, None if there is none"""
+        area = self.group_areas[location]
+        cols = area.width // PICKER_DOT_SPACING
+        col, row = (pos[0] - area.x) // PICKER_DOT_SPACING, (pos[1] - area.y) // PICKER_DOT_SPACING
+        if not area.collidepoint(pos) or col >= cols:
+            return None
+        index = row * cols + col
+        return index if index < len(self.group_dots[location]) else None
+
     def get_picker_position(self, name, state):
         """Calculate the position of a picker based on their state"""
-        if name == 'Loader':
-            return None  # Loader has special handling
+        if name in self.loader_names:
+            return None  # Loaders have special handling
             
         picker_id = int(name.split('-')[1])
         idx = picker_id - 1
         
         # Position around tree, crate, or home based on state
         if 'tree' in state or state.startswith('picked '):
+            center, radius = self.tree_layout[self.picker_trees[name]]
             ang = idx * (2 * math.pi / self.picker_count) - math.pi/2
-            return TREE_POS + pygame.math.Vector2(math.cos(ang), math.sin(ang)) * (TREE_RADIUS * 0.5)
+            return center + pygame.math.Vector2(math.cos(ang), math.sin(ang)) * (radius * 0.5)
         elif 'crate' in state:
             # Position around the crate perimeter based on picker id
             angle_offset = idx * (2 * math.pi / self.picker_count)
@@ -92,9 +240,9 @@ class SimulationState:
                 parts = state.split()
                 if len(parts) >= 4:
                     slot_number = int(parts[3]) - 1  # Convert to 0-based index
-                    if 0 <= slot_number < len(self.crate_positions):
+                    if 0 <= slot_number < self.capacity:
                         # Position the picker just above the slot where they placed the fruit
-                        slot_pos = self.crate_positions[slot_number]
+                        slot_pos = self.crate_position(slot_number)
                         return pygame.math.Vector2(slot_pos.x, slot_pos.y - 20)
             except (ValueError, IndexError):
                 pass
@@ -106,17 +254,17 @@ class SimulationState:
         else:
             return self.initial_positions[name]
             
-    def get_loader_position(self, state):
-        """Calculate the position of the loader based on state"""
-        from config import TRUCK_RECT, CRATE_RECT
+    def get_loader_position(self, name, state):
+        """Calculate the position of a loader based on state"""
+        truck_rect = self.truck_rects[name]
         
         if state == 'waiting full':
-            return self.initial_positions['Loader']
+            return self.initial_positions[name]
         elif state == 'acquired crate':
-            return pygame.math.Vector2(*TRUCK_RECT.center)
+            return pygame.math.Vector2(*truck_rect.center)
         elif state in ('got full', 'waiting crate', 'loading'):
             return pygame.math.Vector2(*CRATE_RECT.center)
         elif state in ('emptied crate', 'partial'):
-            return pygame.math.Vector2(*TRUCK_RECT.center)
+            return pygame.math.Vector2(*truck_rect.center)
         else:
-            return self.initial_positions['Loader']
\ No newline at end of file
+            return self.initial_positions[name]
\ No newline at end of file
@@ -0,0 +1,143 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from events import read_events
+from validate_events import Validator
+
+SWEEP_POLL = 0.01  # seconds between two looks at the running scenarios
+
+# One run of main.py
+Scenario = namedtuple('Scenario', 'fruits pickers capacity seed')
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not on every platform
+        return os.cpu_count() or 1
+
+
+def scenario_processes(scenario, backend='shm'):
+    """Processes one run keeps busy: its pickers, the loader, the EventMerger, main.py, the manager server"""
+    return scenario.pickers + 3 + (backend == 'manager')
+
+
+def check_events(stream):
+    """Structured result of one run's jsonl events: counts and the invariant violations (validate_events.py)"""
+    meta, events = read_events(stream)
+    validator = Validator(meta)
+    crates = count = partial = 0
+    for event in events:
+        validator.feed(event)
+        count += 1
+        if event.event in ('loading', 'partial'):
+            crates += 1
+            if event.event == 'partial':
+                partial = event.slot
+    violations = validator.finish()
+    return {'events': count, 'crates': crates, 'partial': partial, 'violations': validator.count,
+            'ok': not validator.count, 'first_violation': violations[0] if violations else None}
+
+
+def run_sweep(scenarios, backend='shm', cores=None, extra_args=()):
+    """
+    Run the scenarios concurrently and return one result dict per scenario, in order.
+    A scenario is only started while the processes of everything running fit in cores (a scenario that
+    is bigger on its own runs alone), the biggest ones go first so the small ones fill the gaps.
+    """
+    cores = cores or available_cores()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    pending = sorted(range(len(scenarios)), key=lambda i: -scenario_processes(scenarios[i], backend))
+    running = {}  # pid -> (index, weight, start time, output file, Popen)
+    results = [None] * len(scenarios)
+    busy = 0
+
+    while pending or running:
+        # start whatever fits, anything at all if nothing is running
+        for i in list(pending):
+            weight = min(scenario_processes(scenarios[i], backend), cores)
+            if running and busy + weight > cores:
+                continue
+            s = scenarios[i]
+            cmd = [sys.executable, script, "--fruits", str(s.fruits), "--pickers", str(s.pickers),
+                   "--capacity", str(s.capacity), "--seed", str(s.seed), "--backend", backend,
+                   "--events", "jsonl", *extra_args]
+            out = tempfile.TemporaryFile()
+            proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.DEVNULL)
+            running[proc.pid] = (i, weight, time.perf_counter(), out, proc)
+            busy += weight
+            pending.remove(i)
+
+        # reap whichever of our runs finishes first, only their pids - the caller may have children of its own
+        finished = None
+        while finished is None:
+            for pid in running:
+                reaped, status, usage = os.wait4(pid, os.WNOHANG)
+                if reaped:
+                    finished = pid
+                    break
+            else:
+                time.sleep(SWEEP_POLL)
+        i, weight, start, out, proc = running.pop(finished)
+        busy -= weight
+        # (reaped here, the Popen would never learn its exit code otherwise)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        result = dict(scenarios[i]._asdict(), wall=time.perf_counter() - start,
+                      peak_rss_mb=usage.ru_maxrss / 1024, exit=proc.returncode)
+        with out:
+            out.seek(0)
+            if result['exit'] == 0:
+                result.update(check_events(out))
+            else:
+                result['ok'] = False
+        results[i] = result
+    return results
+
+
+def print_table(results, elapsed):
+    """One row per scenario, then the totals"""
+    print(f"{'fruits':>7} | {'pickers':>7} | {'cap':>4} | {'seed':>5} | {'wall s':>7} | {'events':>8} | "
+          f"{'crates':>6} | {'partial':>7} | {'rss MB':>6} | result")
+    for r in results:
+        print(f"{r['fruits']:>7} | {r['pickers']:>7} | {r['capacity']:>4} | {r['seed']:>5} | {r['wall']:>7.2f} | "
+              f"{r.get('events', 0):>8} | {r.get('crates', 0):>6} | {r.get('partial', 0):>7} | "
+              f"{r['peak_rss_mb']:>6.1f} | {'ok' if r['ok'] else 'FAILED'}")
+    for r in results:
+        if r.get('first_violation'):
+            print(f"  f={r['fruits']} p={r['pickers']} c={r['capacity']} seed={r['seed']}: {r['first_violation']}")
+    serial = sum(r['wall'] for r in results)
+    failed = sum(not r['ok'] for r in results)
+    print(f"{len(results)} scenarios, {failed} failed, {elapsed:.1f}s "
+          f"(one after another: {serial:.1f}s, {serial / elapsed if elapsed else 0:.1f}x)")
+
+
+def grid(fruits, pickers, capacities, seeds):
+    return [Scenario(*point) for point in itertools.product(fruits, pickers, capacities, seeds)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a grid of main.py scenarios in parallel")
+    parser.add_argument("--fruits", "-f", type=int, nargs="+", default=[5, 15, 30])
+    parser.add_argument("--pickers", "-p", type=int, nargs="+", default=[3])
+    parser.add_argument("--capacity", "-c", type=int, nargs="+", default=[12])
+    parser.add_argument("--seeds", "-s", type=int, nargs="+", default=[0])
+    parser.add_argument("--backend", "-b", choices=('manager', 'shm'), default="shm")
+    parser.add_argument("--cores", "-j", type=int, default=None,
+                        help="processes the running scenarios may keep busy together (default: available cores)")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    args = parser.parse_args()
+
+    scenarios = grid(args.fruits, args.pickers, args.capacity, args.seeds)
+    start = time.perf_counter()
+    results = run_sweep(scenarios, args.backend, args.cores)
+    print_table(results, time.perf_counter() - start)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
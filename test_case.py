@@ -1,13 +1,27 @@
-import subprocess
+import argparse
 import sys
-import os
+import time
+import sweep
 
 TEST_FRUITS = [5, 15, 30]
-def run_case(fruits):
-    print(f"\n=== Test with {fruits} fruits ===")
-    script = os.path.join(os.path.dirname(__file__), "main.py")
-    subprocess.call([sys.executable, script, "--fruits", str(fruits)])
+# --stress: every run at once on the shm backend, far more processes than cores, so actors get preempted
+# between stamping an event and sending it - the event order is only right if the EventMerger merges exactly
+STRESS_GRID = ([3000], [32, 64], [12], [0, 1, 2])
 
 if __name__ == "__main__":
-    for f in TEST_FRUITS:
-        run_case(f)
+    parser = argparse.ArgumentParser(description="Run the test cases and check their event streams")
+    parser.add_argument("--stress", action="store_true",
+                        help="run STRESS_GRID concurrently on the shm backend instead of the TEST_FRUITS cases")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.stress:
+        scenarios = sweep.grid(*STRESS_GRID)
+        cores = sum(sweep.scenario_processes(s, 'shm') for s in scenarios)
+        results = sweep.run_sweep(scenarios, backend='shm', cores=cores)
+    else:
+        # all cases at once on the sweep runner, one table of checked results instead of the raw output.
+        # manager is main.py's default backend, the one these cases always ran on
+        results = sweep.run_sweep(sweep.grid(TEST_FRUITS, [3], [12], [0]), backend='manager')
+    sweep.print_table(results, time.perf_counter() - start)
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
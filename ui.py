@@ -1,38 +1,83 @@
 import pygame
 import sys
 import argparse
+import multiprocessing as mp
 import time
 import test_case
 import os
 import datetime
+from collections import deque
 
 # Import refactored components
-from config import FPS, SPEED_LEVELS, DEFAULT_SPEED_INDEX, SCREEN_WIDTH, SCREEN_HEIGHT
+from config import FPS, SPEED_LEVELS, DEFAULT_SPEED_INDEX, SCREEN_WIDTH, SCREEN_HEIGHT, FRAME_BUDGET, TIMELINE_RECT
 from simulation_state import SimulationState
 from event_processor import EventProcessor
+from metrics import Metrics
+from replay import Replay
 from ui_components import UIRenderer
+from frame_export import FrameWriter, EXPORT_FORMATS
 
 # Create screenshots directory if it doesn't exist
 SCREENSHOTS_DIR = "screenshots"
 os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
 
+class FrameTimer:
+    """Draw time of the recent frames, shown in the header and summed up when the window closes"""
+
+    def __init__(self, window=FPS * 10):
+        self.recent = deque(maxlen=window)
+        self.frames = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.recent.append(seconds)
+        self.frames += 1
+        self.total += seconds
+
+    def recent_ms(self):
+        return sum(self.recent) / len(self.recent) * 1000 if self.recent else None
+
+    def summary(self):
+        recent = sorted(self.recent)
+        p95 = recent[int(len(recent) * 0.95)] * 1000 if recent else 0
+        return (f"{self.frames} frames drawn, mean {self.total / max(1, self.frames) * 1000:.2f} ms, "
+                f"p95 of the last {len(recent)} {p95:.2f} ms")
+
+
 class UISimulation:
     """Main UI Simulation class that coordinates the simulation components"""
     
-    def __init__(self, fruits, pickers, capacity):
-        """Initialize the simulation with given parameters"""
+    def __init__(self, fruits, pickers, capacity, loaders=1, trees=1, engine='subprocess', replay=None, record=None):
+        """Initialize the simulation with given parameters, a Replay brings its own"""
+        if replay is not None:
+            meta = replay.meta
+            fruits, pickers, capacity = meta['fruits'], meta['pickers'], meta['capacity']
+            loaders, trees = meta.get('loaders', 1), meta.get('trees', 1)
+
         # Create simulation state manager
-        self.state = SimulationState(fruits, pickers, capacity)
+        self.state = SimulationState(fruits, pickers, capacity, loaders, trees)
         
+        # Throughput and utilization for the metrics panel
+        self.metrics = Metrics(self.state.picker_names, self.state.loader_names)
+
         # Create event processor
-        self.event_processor = EventProcessor(fruits, pickers, capacity, self.state)
+        self.event_processor = EventProcessor(fruits, pickers, capacity, self.state, loaders, trees, engine,
+                                              replay, record, self.metrics)
+        self.replay = replay
         
         # Speed control
         self.speed_index = DEFAULT_SPEED_INDEX
         self.event_delay = SPEED_LEVELS[self.speed_index]
+        self.paused = False
+        self.dragging = False  # the replay timeline knob
+        self.hover = None  # mouse position, grouped pickers show a tooltip under it
+        self.frame_timer = FrameTimer()
+        self.shown_ms = None  # draw time in the header, refreshed once a second
+        self.shown_at = 0.0
+        self.show_frame_time = True  # (off for headless exports, their frames should not depend on wall time)
         
         # Create UI renderer
-        self.renderer = UIRenderer(self.state)
+        self.renderer = UIRenderer(self.state, self.metrics)
         
         # Simulation parameters for screenshot naming
         self.fruits = fruits
@@ -40,12 +85,27 @@ class UISimulation:
         self.capacity = capacity
 
     def process_next(self):
-        """Process the next event using the event processor"""
+        """Process the next event using the event processor, as many as fit in the frame at max speed"""
+        if self.paused:
+            return True
+        if self.event_delay == 0:
+            return self.event_processor.advance(FRAME_BUDGET)
         return self.event_processor.process_next(self.event_delay)
 
     def draw(self, screen):
-        """Draw all UI components using the renderer"""
-        self.renderer.draw_all(screen, self.speed_index, self.event_processor.log)
+        """Redraw what changed using the renderer, returns the screen areas to update ([] if nothing did)"""
+        start = time.perf_counter()
+        if self.show_frame_time and start - self.shown_at >= 1.0:
+            self.shown_ms, self.shown_at = self.frame_timer.recent_ms(), start
+        timeline = None
+        if self.replay is not None:
+            timeline = (self.event_processor.current_index, self.replay.count, self.replay.numbers)
+        rects = self.renderer.draw_changed(screen, self.speed_index, self.event_processor.log, self.paused,
+                                           self.shown_ms, timeline, self.hover)
+        # (a frame that only refreshed the draw time itself does not count, or an idle window never settles)
+        if self.renderer.changed and self.renderer.changed != ['frame time']:
+            self.frame_timer.add(time.perf_counter() - start)
+        return rects
 
     def run(self):
         """Run the main simulation loop"""
@@ -66,8 +126,15 @@ class UISimulation:
         while running:
             # Handle events
             for event in pygame.event.get():
+                if event.type == pygame.MOUSEMOTION:
+                    self.hover = event.pos
+                elif event.type == pygame.WINDOWLEAVE:
+                    self.hover = None
                 if event.type == pygame.QUIT:
                     running = False
+                # the window was covered, next frame repaints all of it
+                elif event.type == pygame.WINDOWEXPOSED:
+                    self.renderer.previous = None
                 # When simulation has ended and the summary screen is showing, 
                 # wait for any key press to exit
                 elif is_finished and event.type == pygame.KEYDOWN:
@@ -75,45 +142,101 @@ class UISimulation:
                 # Handle keyboard input for speed control during simulation
                 elif not is_finished and event.type == pygame.KEYDOWN:
                     self._handle_key_input(event)
+                elif not is_finished and self.replay is not None and event.type in (
+                        pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION, pygame.MOUSEBUTTONUP):
+                    self._handle_timeline_input(event)
                         
             # Process next event if simulation is still running
             if not is_finished:
                 still_running = self.process_next()
                 
+                # A replay stays open at its last event, the timeline can still go back
+                if not still_running and self.replay is not None:
+                    self.paused = True
+
                 # If simulation has ended, take screenshot and show summary
-                if not still_running:
+                elif not still_running:
                     is_finished = True
                     
                     # Draw final state before adding overlay
                     self.draw(screen)
                     
                     # Take screenshot of the final state
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    screenshot_filename = os.path.join(
-                        SCREENSHOTS_DIR, 
-                        f"sim_f{self.fruits}_p{self.pickers}_c{self.capacity}_{timestamp}.png"
-                    )
-                    self.renderer.take_screenshot(screen, screenshot_filename)
+                    self._take_screenshot(screen)
                     
                     # Draw summary screen with the final results
                     self.renderer.draw_final_summary(screen)
                     pygame.display.flip()
                     continue
             
-            # Draw everything if not waiting for key press after finishing
+            # Draw what changed if not waiting for key press after finishing
             if not is_finished:
-                self.draw(screen)
+                rects = self.draw(screen)
                 
-                # Update display and maintain frame rate
-                pygame.display.flip()
+                # Update display and maintain frame rate, a frame where nothing changed is skipped
+                if rects:
+                    pygame.display.update(rects)
                 clock.tick(FPS)
             
-        # Clean up pygame
+        # Clean up the simulation and pygame
+        print(self.frame_timer.summary())
+        self.event_processor.close()
         pygame.quit()
+
+    def run_headless(self, writer=None, every=1, events_per_frame=1):
+        """
+        Render the run offscreen as fast as it goes: no window (SDL dummy driver), no frame pacing,
+        events_per_frame events per frame, and every `every`th frame handed to writer (a FrameWriter).
+        """
+        pygame.init()
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.renderer.load_images()
+        self.show_frame_time = False
+
+        start = time.perf_counter()
+        frames = 0
+        running = True
+        while running:
+            before = self.event_processor.current_index
+            running = self.event_processor.advance(limit=events_per_frame)
+            if running and self.event_processor.current_index == before:
+                time.sleep(0.001)  # a live run has not produced the next event yet, no frame for that
+                continue
+            self.draw(screen)
+            if writer is not None and frames % every == 0:
+                writer.write(pygame.image.tobytes(screen, 'RGB'))
+            frames += 1
+        rendered = time.perf_counter() - start
+
+        self._take_screenshot(screen)
+        if writer is not None:
+            writer.close()
+        elapsed = time.perf_counter() - start
+        print(f"{frames} frames ({self.event_processor.current_index} events) rendered in {rendered:.1f}s, "
+              f"{frames / rendered if rendered else 0:.0f} frames/s, "
+              f"{writer.count if writer else 0} exported, done after {elapsed:.1f}s")
+        print(self.frame_timer.summary())
+        self.event_processor.close()
+        pygame.quit()
+
+    def _take_screenshot(self, screen):
+        """Save the current frame under screenshots/"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        screenshot_filename = os.path.join(
+            SCREENSHOTS_DIR,
+            f"sim_f{self.fruits}_p{self.pickers}_c{self.capacity}_{timestamp}.png"
+        )
+        self.renderer.take_screenshot(screen, screenshot_filename)
     
     def _handle_key_input(self, event):
         """Handle keyboard input for simulation control"""
-        if event.key == pygame.K_UP:
+        if event.key == pygame.K_SPACE:
+            self.paused = not self.paused
+        elif event.key == pygame.K_s:
+            # single step, stays paused afterwards
+            self.paused = True
+            self.event_processor.advance(limit=1)
+        elif event.key == pygame.K_UP:
             # Increase speed (decrease delay)
             self.speed_index = min(len(SPEED_LEVELS) - 1, self.speed_index + 1)
             self.event_delay = SPEED_LEVELS[self.speed_index]
@@ -121,6 +244,29 @@ class UISimulation:
             # Decrease speed (increase delay)
             self.speed_index = max(0, self.speed_index - 1)
             self.event_delay = SPEED_LEVELS[self.speed_index]
+        elif self.replay is not None:
+            # seeking through a replay: one event, a twentieth of the run, or to either end
+            step = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1,
+                    pygame.K_PAGEUP: -max(1, self.replay.count // 20),
+                    pygame.K_PAGEDOWN: max(1, self.replay.count // 20),
+                    pygame.K_HOME: -self.replay.count, pygame.K_END: self.replay.count}.get(event.key)
+            if step:
+                self.event_processor.seek(self.event_processor.current_index + step)
+
+    def _handle_timeline_input(self, event):
+        """Drag the replay timeline: snap to checkpoints while dragging (no events to apply), exact on release"""
+        if (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1
+                and TIMELINE_RECT.inflate(0, 16).collidepoint(event.pos)):
+            self.dragging = True
+        elif not self.dragging:
+            return
+        fraction = min(1.0, max(0.0, (event.pos[0] - TIMELINE_RECT.x) / TIMELINE_RECT.width))
+        index = round(fraction * self.replay.count)
+        if event.type == pygame.MOUSEBUTTONUP:
+            self.dragging = False
+            self.event_processor.seek(index)
+        else:
+            self.event_processor.seek(self.replay.checkpoint_number(index))
 
 
 if __name__ == '__main__':
@@ -131,16 +277,75 @@ if __name__ == '__main__':
                        help='Capacity of the crate (default: 12)')
     parser.add_argument('-f', '--fruits', type=int, default=15, 
                        help='Number of fruits to simulate (default: 15)')
+    parser.add_argument('-l', '--loaders', type=int, default=1,
+                       help='Number of loaders, each with its own truck (default: 1)')
+    parser.add_argument('-t', '--trees', type=int, default=1,
+                       help='Number of trees the fruits are split over (default: 1)')
+    parser.add_argument('--engine', choices=EventProcessor.ENGINES, default='subprocess',
+                       help='subprocess runs main.py and reads its event stream, '
+                            'inprocess hosts the pickers and loaders in this process tree (default: subprocess)')
+    parser.add_argument('--record', metavar='FILE',
+                       help='Save the event stream of the run to FILE (jsonl) and index it for --replay')
+    parser.add_argument('--replay', metavar='FILE',
+                       help='Play back a recorded jsonl or binary event log instead of running the simulation, '
+                            'the parameters come from the log')
+    parser.add_argument('--seek', type=int, default=0, metavar='N',
+                       help='Start a replay right after event N')
+    parser.add_argument('--headless', action='store_true',
+                       help='No window: render offscreen as fast as possible, without frame pacing')
+    parser.add_argument('--export', metavar='PATH',
+                       help='With --headless, write the frames to PATH: a directory of PNGs, or one raw rgb24 file')
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, default='png',
+                       help='png writes PATH/frame_000000.png .., raw writes the frames back to back (default: png)')
+    parser.add_argument('--frame-every', type=int, default=1, metavar='N',
+                       help='Export every Nth frame (default: 1)')
+    parser.add_argument('--events-per-frame', type=int, default=1, metavar='K',
+                       help='Events applied per frame with --headless (default: 1)')
     parser.add_argument('--run-all-tests', action='store_true',
                        help='Run all test cases sequentially')
     args = parser.parse_args()
+    if args.export and not args.headless:
+        parser.error("--export needs --headless")
+    if args.frame_every < 1 or args.events_per_frame < 1:
+        parser.error("--frame-every and --events-per-frame must be at least 1")
+    if args.headless:
+        # has to be set before pygame opens the display
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+    def play(sim, export=None):
+        """Run sim in a window, or headless into export"""
+        if not args.headless:
+            sim.run()
+            return
+        writer = None
+        if export:
+            writer = FrameWriter(export, (SCREEN_WIDTH, SCREEN_HEIGHT), args.export_format)
+        sim.run_headless(writer, args.frame_every, args.events_per_frame)
+
+    # the in-process engine starts its pickers and loaders from here. Not forked from this process, its pygame
+    # and reader threads are running by then, but from a forkserver with this file's modules preloaded: every
+    # child re-runs ui.py as __mp_main__, which is quick once pygame, numpy and the rest are imported.
+    # (Windows has no forkserver and keeps spawn, each child importing them again)
+    if 'forkserver' in mp.get_all_start_methods():
+        mp.set_start_method('forkserver')
+        mp.set_forkserver_preload(['ui', 'main'])
+        if args.engine == 'inprocess':
+            from multiprocessing import forkserver
+            forkserver.ensure_running()  # importing them there overlaps with opening the window
+    else:
+        mp.set_start_method('spawn')
     
-    if args.run_all_tests:
-        # Run all test cases in sequence
+    if args.replay:
+        sim = UISimulation(args.fruits, args.pickers, args.capacity, replay=Replay(args.replay))
+        sim.event_processor.seek(args.seek)
+        play(sim, args.export)
+    elif args.run_all_tests:
+        # Run all test cases in sequence, each exports next to the others
         for fruits in test_case.TEST_FRUITS:
-            sim = UISimulation(fruits, args.pickers, args.capacity)
-            sim.run()
+            sim = UISimulation(fruits, args.pickers, args.capacity, args.loaders, args.trees, args.engine)
+            play(sim, args.export and f"{args.export}_f{fruits}")
     else:
         # Run only a single simulation with the specified parameters
-        sim = UISimulation(args.fruits, args.pickers, args.capacity)
-        sim.run()
+        sim = UISimulation(args.fruits, args.pickers, args.capacity, args.loaders, args.trees, args.engine,
+                           record=args.record)
+        play(sim, args.export)
@@ -1,20 +1,70 @@
 import pygame
-import math
+from array import array
+from collections import OrderedDict
+from functools import partial
+from itertools import repeat
 from config import *
+from metrics import PICKER_WAITS
+try:
+    import numpy as np
+except ImportError:  # optional, density rendering falls back to plain lists
+    np = None
+
+HEADER_RECT = pygame.Rect(25, PADDING + HEADER_FONT_SIZE + 20, 250, FONT_SIZE + 10)
+FRAME_TIME_RECT = pygame.Rect(285, PADDING + HEADER_FONT_SIZE + 20, 120, FONT_SIZE + 10)
+PICKER_COLORS = [BLUE, DARK_BLUE, (70, 150, 210)]  # picker i gets color i % 3
+LOG_RECT = pygame.Rect(TEXT_AREA_X + 20, PADDING + HEADER_FONT_SIZE + 20, SCREEN_WIDTH - TEXT_AREA_X - 20,
+                       MAX_LOG_LINES * (FONT_SIZE + 5))  # (long lines run past the panel, to the screen edge)
+METRICS_RECT = pygame.Rect(TEXT_AREA_X + 20, LOG_RECT.bottom + 8, SCREEN_WIDTH - TEXT_AREA_X - 50,
+                           SCREEN_HEIGHT - LOG_RECT.bottom - 28)  # metrics panel, under the log
 
 class UIRenderer:
-    """Handles rendering of all UI components"""
+    """
+    Handles rendering of all UI components.
+    What never changes (panels, title, tree and truck images, the empty crate) is composited once onto
+    static_layer, fonts are loaded once and rendered text is kept in an LRU cache.
+    draw_changed only redraws the items whose content or position changed since the previous frame.
+    """
     
-    def __init__(self, simulation_state):
-        """Initialize the UI renderer with simulation state"""
+    def __init__(self, simulation_state, metrics=None):
+        """Initialize the UI renderer with simulation state, and the metrics.Metrics of the panel if it has one"""
         self.state = simulation_state
+        self.metrics = metrics
         self.images = {}
+        self.fonts = {}
+        self.texts = OrderedDict()  # (size, bold, text, color) -> surface, least recently used first
+        self.static_layer = None
+        self.previous = None  # item name -> (key, rect) of the last frame drawn
+        self.changed = []  # names of the items the last draw_changed redrew
+        self.canvas = None  # scratch surface draw_changed repaints the changed areas on
+        self.densities = {}  # tree -> FruitDensity, once the tree had more fruits than FRUIT_DENSITY_THRESHOLD
+
+    def font(self, size=FONT_SIZE, bold=False):
+        """SysFont is slow, every size is loaded once"""
+        key = (size, bold)
+        if key not in self.fonts:
+            self.fonts[key] = pygame.font.SysFont(None, size, bold=bold)
+        return self.fonts[key]
+
+    def text(self, text, color, size=FONT_SIZE, bold=False):
+        """Rendered text surface, the last TEXT_CACHE_SIZE of them stay cached"""
+        key = (size, bold, text, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            surface = self.texts[key] = self.font(size, bold).render(text, True, color)
+            if len(self.texts) > TEXT_CACHE_SIZE:
+                self.texts.popitem(last=False)
+        else:
+            self.texts.move_to_end(key)
+        return surface
         
     def load_images(self):
         """Load and scale all required images"""
+        # every tree has the same radius, one scaled image does for all of them
+        tree_radius = self.state.tree_layout[0][1]
         self.images['tree'] = pygame.transform.smoothscale(
             pygame.image.load(ASSET_PATHS['tree']).convert_alpha(),
-            (int(TREE_RADIUS*2), int(TREE_RADIUS*2)))
+            (int(tree_radius*2), int(tree_radius*2)))
             
         self.images['truck'] = pygame.transform.smoothscale(
             pygame.image.load(ASSET_PATHS['truck']).convert_alpha(),
@@ -23,7 +73,48 @@ class UIRenderer:
         self.images['loader'] = pygame.transform.smoothscale(
             pygame.image.load(ASSET_PATHS['loader']).convert_alpha(),
             (LOADER_SIZE, LOADER_SIZE))
-        
+
+        # one pre-rendered fruit (shadow, fruit, outline) blitted for every fruit on the trees
+        self.fruit_radius = max(3, int(7 * tree_radius / TREE_RADIUS))
+        self.images['fruit'] = fruit_sprite(self.fruit_radius)
+        # and the dots of grouped pickers, one per picker color
+        self.images['dots'] = [picker_dot(color) for color in PICKER_COLORS]
+        
+    def build_static_layer(self, screen):
+        """Composite everything that never changes onto one surface the size of the screen"""
+        layer = pygame.Surface(screen.get_size()).convert()
+        self.draw_background(layer)
+
+        # Header with title
+        title_bg = pygame.Rect(25, PADDING, 300, HEADER_FONT_SIZE + 10)
+        pygame.draw.rect(layer, MEDIUM_GREEN, title_bg)
+        pygame.draw.rect(layer, DARK_BLUE, title_bg, 1)
+        layer.blit(self.text(f"Orchard: {self.state.total_fruits} Fruits", WHITE, HEADER_FONT_SIZE, True),
+                   (30, PADDING + 5))
+
+        # Tree images
+        if 'tree' in self.images:
+            for center, radius in self.state.tree_layout:
+                layer.blit(self.images['tree'], self.images['tree'].get_rect(center=(int(center.x), int(center.y))))
+
+        # The empty crate: shadow, body and slot grid (the outline shows how full it is, so it is drawn per frame)
+        shadow_rect = pygame.Rect(CRATE_RECT.x+4, CRATE_RECT.y+4, CRATE_RECT.width, CRATE_RECT.height)
+        pygame.draw.rect(layer, (100, 100, 100, 128), shadow_rect)
+        pygame.draw.rect(layer, LIGHT_BROWN, CRATE_RECT)
+        self._draw_crate_slots(layer)
+
+        # Trucks
+        if 'truck' in self.images:
+            for truck_rect in self.state.truck_rects.values():
+                layer.blit(self.images['truck'], truck_rect)
+
+        # Log title
+        log_title_bg = pygame.Rect(TEXT_AREA_X+20, PADDING, 120, HEADER_FONT_SIZE + 10)
+        pygame.draw.rect(layer, MEDIUM_GREEN, log_title_bg)
+        pygame.draw.rect(layer, DARK_BLUE, log_title_bg, 1)
+        layer.blit(self.text('Event Log', WHITE, HEADER_FONT_SIZE, True), (TEXT_AREA_X+25, PADDING + 5))
+        return layer
+
     def draw_background(self, screen):
         """Draw background panels"""
         screen.fill(LIGHT_GREEN)
@@ -36,94 +127,81 @@ class UIRenderer:
         pygame.draw.rect(screen, PANEL_COLOR, (TEXT_AREA_X+10, 10, SCREEN_WIDTH-TEXT_AREA_X-20, SCREEN_HEIGHT-20))
         pygame.draw.rect(screen, PANEL_BORDER, (TEXT_AREA_X+10, 10, SCREEN_WIDTH-TEXT_AREA_X-20, SCREEN_HEIGHT-20), 2)
 
-    def draw_header(self, screen, speed_index):
-        """Draw header with simulation info and speed controls"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        hdr = pygame.font.SysFont(None, HEADER_FONT_SIZE, bold=True)
-        
-        # Header with title
-        title_bg = pygame.Rect(25, PADDING, 300, HEADER_FONT_SIZE + 10)
-        pygame.draw.rect(screen, MEDIUM_GREEN, title_bg)
-        pygame.draw.rect(screen, DARK_BLUE, title_bg, 1)
-        screen.blit(hdr.render(f"Orchard: {self.state.total_fruits} Fruits", True, WHITE), 
-                  (30, PADDING + 5))
-        
+    def draw_header(self, screen, speed_index, paused=False):
+        """Draw the speed controls under the title (the title itself is on the static layer)"""
         # Speed control indicator
-        speed_bg = pygame.Rect(25, PADDING + HEADER_FONT_SIZE + 20, 250, FONT_SIZE + 10)
+        speed_bg = HEADER_RECT
         pygame.draw.rect(screen, MEDIUM_GREEN, speed_bg)
         pygame.draw.rect(screen, DARK_BLUE, speed_bg, 1)
-        speed_text = f"Speed: {5-speed_index}/5 (↑/↓ to change)"
-        screen.blit(font.render(speed_text, True, WHITE), 
-                  (30, PADDING + HEADER_FONT_SIZE + 25))
+        if paused:
+            speed_text = "Paused (space, S steps)"
+        elif SPEED_LEVELS[speed_index] == 0:
+            speed_text = "Speed: max (↑/↓ to change)"
+        else:
+            speed_text = f"Speed: {speed_index + 1}/{len(SPEED_LEVELS)} (↑/↓ to change)"
+        screen.blit(self.text(speed_text, WHITE), (30, PADDING + HEADER_FONT_SIZE + 25))
+
+    def draw_frame_time(self, screen, frame_ms):
+        """Draw time of the recent frames, next to the speed controls"""
+        if frame_ms is not None:
+            screen.blit(self.text(f"draw {frame_ms:.1f} ms", GRAY), (285, PADDING + HEADER_FONT_SIZE + 25))
+
+    def draw_tree(self, screen, tree):
+        """Draw the fruits on one tree (the tree images are on the static layer)"""
+        center, radius = self.state.tree_layout[tree]
+        remaining = self.state.tree_counts[tree]
+
+        # Many fruits are drawn as a density map, cost bounded by the tree's area instead of its fruits
+        if remaining > FRUIT_DENSITY_THRESHOLD:
+            if tree not in self.densities:
+                self.densities[tree] = FruitDensity(self.state.fruit_x[tree], self.state.fruit_y[tree])
+            self.densities[tree].draw(screen, remaining)
+        else:
+            # one sprite blit per fruit, the sprite is offset so (x, y) is the fruit's center
+            xs, ys = self.state.fruit_x[tree][:remaining], self.state.fruit_y[tree][:remaining]
+            if np is not None:
+                xs, ys = xs.tolist(), ys.tolist()
+            r = self.fruit_radius
+            screen.blits(zip(repeat(self.images['fruit']), zip([x - r for x in xs], [y - r for y in ys])),
+                         doreturn=False)
 
-    def draw_tree(self, screen):
-        """Draw the tree and fruits"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        
-        # Draw tree image
-        if 'tree' in self.images:
-            screen.blit(self.images['tree'], 
-                      self.images['tree'].get_rect(center=(int(TREE_POS.x), int(TREE_POS.y))))
-        
-        # Draw fruits on tree with shadows
-        for pos in self.state.fruit_positions[:self.state.tree_fruits]:
-            # Shadow
-            pygame.draw.circle(screen, (100, 100, 100, 128), (int(pos.x+2), int(pos.y+2)), 7)
-            # Fruit
-            pygame.draw.circle(screen, YELLOW, (int(pos.x), int(pos.y)), 7)
-            pygame.draw.circle(screen, ORANGE, (int(pos.x), int(pos.y)), 7, 1)
-        
         # Tree info box
-        tree_info_bg = pygame.Rect(TREE_POS.x - 50, TREE_POS.y - TREE_RADIUS - 40, 100, 25)
+        label = "Tree" if self.state.tree_count == 1 else f"Tree {tree + 1}"
+        tree_info_bg = pygame.Rect(center.x - 50, center.y - radius - 40, 100, 25)
         pygame.draw.rect(screen, MEDIUM_GREEN, tree_info_bg)
         pygame.draw.rect(screen, DARK_BLUE, tree_info_bg, 1)
-        screen.blit(font.render(f"Tree: {self.state.tree_fruits}", True, WHITE),
-                  (TREE_POS.x - 45, TREE_POS.y - TREE_RADIUS - 35))
+        screen.blit(self.text(f"{label}: {remaining}", WHITE), (center.x - 45, center.y - radius - 35))
 
     def draw_crate(self, screen):
-        """Draw the crate and its contents"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        
+        """Draw the crate outline and contents (the empty crate is on the static layer)"""
         # Determine crate color based on fullness
-        filled_slot_count = sum(1 for slot in self.state.crate_slots if slot > 0)
+        filled_slot_count = self.state.crate_count
         crate_color = GREEN if filled_slot_count >= self.state.capacity else BROWN
         
-        # Draw crate shadow
-        shadow_rect = pygame.Rect(CRATE_RECT.x+4, CRATE_RECT.y+4, CRATE_RECT.width, CRATE_RECT.height)
-        pygame.draw.rect(screen, (100, 100, 100, 128), shadow_rect)
-        
         # Draw crate outline
-        pygame.draw.rect(screen, LIGHT_BROWN, CRATE_RECT)
         pygame.draw.rect(screen, crate_color, CRATE_RECT, 3)
         
-        # Draw fruit background slots
-        self._draw_crate_slots(screen)
-        
         # Draw fruits in crate
         self._draw_crate_contents(screen)
         
         # Crate info box - show actual count of filled slots
-        filled_slot_count = sum(1 for slot in self.state.crate_slots if slot > 0)
         crate_status = "FULL" if filled_slot_count >= self.state.capacity else f"{filled_slot_count}/{self.state.capacity}"
         crate_info_bg = pygame.Rect(CRATE_RECT.x, CRATE_RECT.y - 30, 120, 25)
         pygame.draw.rect(screen, MEDIUM_GREEN, crate_info_bg)
         pygame.draw.rect(screen, DARK_BLUE, crate_info_bg, 1)
-        screen.blit(font.render(f"Crate: {crate_status}", True, WHITE),
-                  (CRATE_RECT.x + 5, CRATE_RECT.y - 25))
+        screen.blit(self.text(f"Crate: {crate_status}", WHITE), (CRATE_RECT.x + 5, CRATE_RECT.y - 25))
                   
     def _draw_crate_slots(self, screen):
         """Draw the empty slot markers in the crate"""
-        small_font = pygame.font.SysFont(None, int(FONT_SIZE * 0.7))
-        
         for i in range(self.state.capacity):
-            pos = self.state.crate_positions[i]
+            pos = self.state.crate_position(i)
             slot_number = i + 1
             
             # Draw subtle grid markers
             pygame.draw.circle(screen, (220, 220, 200), (int(pos.x), int(pos.y)), 8, 1)
             
             # Small slot number markers
-            slot_text = small_font.render(f"{slot_number}", True, GRAY)
+            slot_text = self.text(f"{slot_number}", GRAY, int(FONT_SIZE * 0.7))
             screen.blit(slot_text, (int(pos.x - slot_text.get_width()/2), 
                                   int(pos.y - slot_text.get_height()/2)))
                                   
@@ -131,7 +209,7 @@ class UIRenderer:
         """Draw fruits in the crate based on crate_slots data"""
         for slot_idx, fruit_num in enumerate(self.state.crate_slots):
             if fruit_num > 0:  # If there's a fruit in this slot
-                pos = self.state.crate_positions[slot_idx]
+                pos = self.state.crate_position(slot_idx)
                 # Shadow
                 pygame.draw.circle(screen, (100, 100, 100, 128), (int(pos.x+1), int(pos.y+1)), 9)
                 # Fruit
@@ -139,12 +217,15 @@ class UIRenderer:
                 pygame.draw.circle(screen, ORANGE, (int(pos.x), int(pos.y)), 9, 1)
 
     def draw_truck(self, screen):
-        """Draw the truck and delivery info"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        
-        # Draw truck image
-        if 'truck' in self.images:
-            screen.blit(self.images['truck'], TRUCK_RECT)
+        """Draw the delivery info (the trucks are on the static layer)"""
+        for name, truck_rect in self.state.truck_rects.items():
+            # With several loaders tag each truck with its own deliveries
+            if self.state.loader_count > 1:
+                tag_bg = pygame.Rect(truck_rect.x, truck_rect.y, 110, FONT_SIZE + 4)
+                pygame.draw.rect(screen, MEDIUM_GREEN, tag_bg)
+                pygame.draw.rect(screen, DARK_BLUE, tag_bg, 1)
+                screen.blit(self.text(f"{name}: {self.state.truck_loads[name]}", WHITE),
+                          (truck_rect.x + 4, truck_rect.y + 3))
             
         # Truck info panel
         truck_info_bg = pygame.Rect(TRUCK_RECT.x, TRUCK_RECT.y + TRUCK_RECT.height + 5, 160, 50)
@@ -152,53 +233,100 @@ class UIRenderer:
         pygame.draw.rect(screen, DARK_BLUE, truck_info_bg, 1)
         
         # Delivery counts
-        screen.blit(font.render(f"Crates delivered: {self.state.loaded_crates}", True, WHITE),
+        screen.blit(self.text(f"Crates delivered: {self.state.loaded_crates}", WHITE),
                   (TRUCK_RECT.x + 10, TRUCK_RECT.y + TRUCK_RECT.height + 10))
-        screen.blit(font.render(f"Fruits delivered: {self.state.loaded_fruits}", True, WHITE),
+        screen.blit(self.text(f"Fruits delivered: {self.state.loaded_fruits}", WHITE),
                   (TRUCK_RECT.x + 10, TRUCK_RECT.y + TRUCK_RECT.height + 30))
 
-    def draw_pickers(self, screen):
-        """Draw all pickers with their states"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        
-        for idx, (name, state) in enumerate(self.state.states.items()):
-            # Skip the loader, it's drawn separately
-            if name == 'Loader':
-                continue
-                
-            picker_id = int(name.split('-')[1])
-            
-            # Get position based on state
-            base = self.state.get_picker_position(name, state)
-            
-            # Different colors for different pickers
-            picker_colors = [BLUE, DARK_BLUE, (70, 150, 210)]
-            color_idx = (picker_id - 1) % len(picker_colors)
-            
-            # Draw picker shadow for depth
-            pygame.draw.circle(screen, (100, 100, 100, 128), (int(base.x+2), int(base.y+2)), 14)
-            
-            # Draw picker with outer ring
-            pygame.draw.circle(screen, picker_colors[color_idx], (int(base.x), int(base.y)), 14)
-            pygame.draw.circle(screen, WHITE, (int(base.x), int(base.y)), 14, 2)
-            
-            # Draw picker label and state box
-            text_bg = pygame.Rect(base.x + 15 - 2, base.y - 14, 150, 45)
-            pygame.draw.rect(screen, (240, 240, 240, 230), text_bg)
-            pygame.draw.rect(screen, picker_colors[color_idx], text_bg, 2)
-            
-            # Label and state text
-            screen.blit(font.render(name, True, BLACK), (base.x + 18, base.y - 10))
-            screen.blit(font.render(state, True, RED), (base.x + 18, base.y + 8))
+    def draw_picker(self, screen, name, state, base):
+        """Draw a picker with its state at base"""
+        picker_id = int(name.split('-')[1])
 
-    def draw_loader(self, screen):
-        """Draw the loader with its state"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        
-        # Get loader position based on state
-        lstate = self.state.states['Loader']
-        base = self.state.get_loader_position(lstate)
+        # Different colors for different pickers
+        color_idx = (picker_id - 1) % len(PICKER_COLORS)
+
+        # Draw picker shadow for depth
+        pygame.draw.circle(screen, (100, 100, 100, 128), (int(base.x+2), int(base.y+2)), 14)
+
+        # Draw picker with outer ring
+        pygame.draw.circle(screen, PICKER_COLORS[color_idx], (int(base.x), int(base.y)), 14)
+        pygame.draw.circle(screen, WHITE, (int(base.x), int(base.y)), 14, 2)
+
+        # Draw picker label and state box
+        text_bg = pygame.Rect(base.x + 15 - 2, base.y - 14, 150, 45)
+        pygame.draw.rect(screen, (240, 240, 240, 230), text_bg)
+        pygame.draw.rect(screen, PICKER_COLORS[color_idx], text_bg, 2)
 
+        # Label and state text
+        screen.blit(self.text(name, BLACK), (base.x + 18, base.y - 10))
+        screen.blit(self.text(state, RED), (base.x + 18, base.y + 8))
+
+    def _picker_rect(self, name, state, base):
+        """Area draw_picker paints"""
+        rect = pygame.Rect(int(base.x) - 15, int(base.y) - 15, 32, 32).union(
+            pygame.Rect(base.x + 13, base.y - 14, 150, 45))
+        rect.union_ip(self.text(name, BLACK).get_rect(topleft=(base.x + 18, base.y - 10)))
+        rect.union_ip(self.text(state, RED).get_rect(topleft=(base.x + 18, base.y + 8)))
+        return rect.inflate(2, 2)
+
+    def draw_picker_group(self, screen, location, members, badge):
+        """Draw the pickers at one location: their count and a dot per picker (as many as fit)"""
+        if not members:
+            return
+        pygame.draw.rect(screen, MEDIUM_GREEN, badge)
+        pygame.draw.rect(screen, DARK_BLUE, badge, 1)
+        screen.blit(self.text(self._group_label(location, len(members)), WHITE), (badge.x + 5, badge.y + 2))
+        dots = self.images['dots']
+        half = PICKER_DOT_SPACING // 2
+        screen.blits([(dots[i % len(dots)], (x - half, y - half))
+                      for i, (x, y) in zip(members, self.state.group_dots[location])], doreturn=False)
+
+    def _group_label(self, location, count):
+        shown = len(self.state.group_dots[location])
+        label = f"{count} picker{'s' if count != 1 else ''}"
+        return label if count <= shown else f"{label} ({shown} shown)"
+
+    def draw_tooltip(self, screen, name, state, rect):
+        """Name and state of the grouped picker under the mouse"""
+        pygame.draw.rect(screen, (240, 240, 240), rect)
+        pygame.draw.rect(screen, DARK_BLUE, rect, 2)
+        screen.blit(self.text(name, BLACK), (rect.x + 5, rect.y + 4))
+        screen.blit(self.text(state, RED), (rect.x + 5, rect.y + 22))
+
+    def _picker_group_items(self, hover=None):
+        """
+        Items of the grouped pickers: one per location (a tree, the crate, home) instead of one per picker,
+        so a frame costs the same for 30 pickers or 1000. Returns them and the tooltip of the picker under
+        hover, [] or one item.
+        """
+        state = self.state
+        groups = {location: [] for location in state.group_areas}
+        for i, name in enumerate(state.picker_names):
+            groups[state.picker_location(name, state.states[name])].append(i)
+
+        items = []
+        name = None
+        for location, members in groups.items():
+            area = state.group_areas[location]
+            badge = self.text(self._group_label(location, len(members)), WHITE).get_rect(
+                topleft=(area.x, area.y - 24)).inflate(10, 4).move(5, 2)
+            items.append((f'pickers {location}', tuple(members), area.union(badge).inflate(2, 2),
+                          partial(self.draw_picker_group, location=location, members=members, badge=badge)))
+            index = state.group_dot_at(location, hover) if hover is not None else None
+            if index is not None and index < len(members):
+                name = state.picker_names[members[index]]
+        if name is None:
+            return items, []
+
+        pstate = state.states[name]
+        width = max(self.text(name, BLACK).get_width(), self.text(pstate, RED).get_width()) + 10
+        rect = pygame.Rect(hover[0] + 12, hover[1] + 12, width, 44)
+        rect.clamp_ip(pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        return items, [('tooltip', (name, pstate, rect.topleft), rect,
+                        partial(self.draw_tooltip, name=name, state=pstate, rect=rect))]
+
+    def draw_loader(self, screen, name, lstate, base):
+        """Draw the loader with its state at base"""
         if 'loader' in self.images:
             # Shadow
             shadow_rect = self.images['loader'].get_rect(center=(int(base.x+5), int(base.y+5)))
@@ -219,20 +347,11 @@ class UIRenderer:
         loader_text_bg = pygame.Rect(base.x - 60, base.y + LOADER_SIZE/2 + 5, 120, 25)
         pygame.draw.rect(screen, (240, 240, 240, 230), loader_text_bg)
         pygame.draw.rect(screen, RED, loader_text_bg, 2)
-        screen.blit(font.render(lstate, True, RED),
+        screen.blit(self.text(lstate, RED),
                   (base.x - 55, base.y + LOADER_SIZE/2 + 7))
 
     def draw_event_log(self, screen, log):
-        """Draw the event log panel"""
-        font = pygame.font.SysFont(None, FONT_SIZE)
-        hdr = pygame.font.SysFont(None, HEADER_FONT_SIZE, bold=True)
-        
-        # Log title
-        log_title_bg = pygame.Rect(TEXT_AREA_X+20, PADDING, 120, HEADER_FONT_SIZE + 10)
-        pygame.draw.rect(screen, MEDIUM_GREEN, log_title_bg)
-        pygame.draw.rect(screen, DARK_BLUE, log_title_bg, 1)
-        screen.blit(hdr.render('Event Log', True, WHITE), (TEXT_AREA_X+25, PADDING + 5))
-        
+        """Draw the event log entries (the title is on the static layer)"""
         # Log entries with alternate row coloring
         for i, line in enumerate(log):
             y_pos = PADDING + HEADER_FONT_SIZE + 20 + i * (FONT_SIZE + 5)
@@ -240,28 +359,186 @@ class UIRenderer:
             if i % 2 == 0:
                 row_bg = pygame.Rect(TEXT_AREA_X+20, y_pos, SCREEN_WIDTH-TEXT_AREA_X-40, FONT_SIZE + 4)
                 pygame.draw.rect(screen, (230, 240, 255), row_bg)
-            screen.blit(font.render(line, True, BLACK),
-                      (TEXT_AREA_X + 25, y_pos + 2))
+            screen.blit(self.text(line, BLACK), (TEXT_AREA_X + 25, y_pos + 2))
     
-    def draw_all(self, screen, speed_index, log):
+    def draw_metrics(self, screen):
+        """Draw the metrics panel: throughput and utilization with their sparklines, where the pickers wait"""
+        metrics = self.metrics
+        x, y, width = METRICS_RECT.x, METRICS_RECT.y, METRICS_RECT.width
+        size = FONT_SIZE - 3
+        # the panel only gets METRICS_RECT repainted, a long bottleneck line must not run past it
+        clip = screen.get_clip()
+        screen.set_clip(clip.clip(METRICS_RECT))
+        screen.blit(self.text("Metrics", BLACK, FONT_SIZE, bold=True), (x, y))
+        y += 22
+
+        latest = metrics.latest or dict.fromkeys(metrics.history, 0.0)
+        rows = [(f"fruits/s {latest['fruits/s']:.1f}", 'fruits/s', GREEN, None),
+                (f"crate fill {latest['crate fill']:.3f}s", 'crate fill', BROWN, None),
+                (f"loaders busy {latest['loaders busy']:.0%}", 'loaders busy', RED, 1.0),
+                (f"pickers working {latest['pickers working']:.0%}", 'pickers working', BLUE, 1.0)]
+        for label, key, color, top in rows:
+            screen.blit(self.text(label, BLACK, size), (x, y))
+            draw_sparkline(screen, pygame.Rect(x + 150, y + 1, width - 150, 16), metrics.history[key], color, top)
+            y += 21
+
+        if metrics.latest is not None:
+            waits = "  ".join(f"{kind.split()[1]} {latest[kind]:.0%}" for kind in PICKER_WAITS)
+            screen.blit(self.text(f"pickers wait: {waits}", BLACK, size), (x, y))
+        y += 21
+
+        # one column per picker (pickers share a column when there are more than fit), as tall as it works
+        strip = pygame.Rect(x, y, width, 18)
+        pygame.draw.rect(screen, (230, 240, 255), strip)
+        utilization = metrics.utilization
+        columns = min(len(utilization), width)  # (0 before the first sample)
+        for c in range(columns):
+            group = utilization[c * len(utilization) // columns:(c + 1) * len(utilization) // columns]
+            height = round(strip.height * sum(group) / len(group))
+            left, right = strip.x + c * width // columns, strip.x + (c + 1) * width // columns
+            pygame.draw.rect(screen, BLUE, (left, strip.bottom - height, max(1, right - left - 1), height))
+        y += 22
+
+        screen.blit(self.text(metrics.bottleneck(), RED, size), (x, y))
+        screen.set_clip(clip)
+
+    def draw_timeline(self, screen, position, count, marks):
+        """Draw the replay timeline: progress through the run, a tick per checkpoint (when they fit)"""
+        bar = TIMELINE_RECT
+        pygame.draw.rect(screen, PANEL_COLOR, bar.inflate(10, 28).move(0, -7))
+        pygame.draw.rect(screen, GRAY, bar)
+        done = bar.width * position // max(1, count)
+        pygame.draw.rect(screen, MEDIUM_GREEN, (bar.x, bar.y, done, bar.height))
+        if len(marks) < bar.width // 4:
+            for mark in marks:
+                x = bar.x + bar.width * mark // max(1, count)
+                pygame.draw.line(screen, DARK_BLUE, (x, bar.bottom - 4), (x, bar.bottom))
+        pygame.draw.rect(screen, DARK_BLUE, bar, 1)
+        pygame.draw.circle(screen, DARK_BLUE, (bar.x + done, bar.centery), bar.height // 2 + 2)
+        screen.blit(self.text(f"event {position}/{count}  (drag, Left/Right, PgUp/PgDn, Home/End)", BLACK),
+                    (bar.x, bar.y - 16))
+
+    def _loader_rect(self, lstate, base):
+        """Area draw_loader paints"""
+        if 'loader' in self.images:
+            rect = self.images['loader'].get_rect(center=(int(base.x), int(base.y)))
+            rect.union_ip(rect.move(5, 5))
+        else:
+            rect = pygame.Rect(base.x - LOADER_SIZE/2, base.y - LOADER_SIZE/2, LOADER_SIZE, LOADER_SIZE)
+        rect.union_ip(pygame.Rect(base.x - 60, base.y + LOADER_SIZE/2 + 5, 120, 25))
+        rect.union_ip(self.text(lstate, RED).get_rect(topleft=(base.x - 55, base.y + LOADER_SIZE/2 + 7)))
+        return rect.inflate(2, 2)
+
+    def items(self, speed_index, log, paused=False, frame_ms=None, timeline=None, hover=None):
+        """
+        What a frame is made of, in drawing order: (name, key, rect, draw) per item.
+        key holds everything the item's pixels depend on, rect covers all of them, draw(screen) paints it.
+        hover is the mouse position, for the tooltips of grouped pickers.
+        """
+        state = self.state
+        items = [('header', (speed_index, paused), HEADER_RECT,
+                  partial(self.draw_header, speed_index=speed_index, paused=paused)),
+                 ('frame time', frame_ms, FRAME_TIME_RECT, partial(self.draw_frame_time, frame_ms=frame_ms))]
+
+        # Simulation elements
+        for tree, (center, radius) in enumerate(state.tree_layout):
+            rect = pygame.Rect(center.x - radius, center.y - radius - 40, radius * 2, radius * 2 + 40)
+            items.append((f'tree {tree}', state.tree_counts[tree], rect, partial(self.draw_tree, tree=tree)))
+        crate_rect = CRATE_RECT.inflate(4, 4).union(pygame.Rect(CRATE_RECT.x, CRATE_RECT.y - 30, 120, 25))
+        items.append(('crate', state.crate_version, crate_rect, self.draw_crate))
+        truck_rect = pygame.Rect(TRUCK_RECT.x, TRUCK_RECT.y + TRUCK_RECT.height + 5, 160, 50)
+        if state.loader_count > 1:
+            for truck in state.truck_rects.values():
+                truck_rect.union_ip(pygame.Rect(truck.x, truck.y, 110, FONT_SIZE + 4))
+        items.append(('trucks', (tuple(state.truck_loads.values()), state.loaded_crates, state.loaded_fruits),
+                      truck_rect, self.draw_truck))
+
+        # Actors, past PICKER_LOD_THRESHOLD pickers are grouped by location
+        tooltip = []
+        if state.picker_count > PICKER_LOD_THRESHOLD:
+            groups, tooltip = self._picker_group_items(hover)
+            items.extend(groups)
+        else:
+            for name in state.picker_names:
+                pstate = state.states[name]
+                base = state.get_picker_position(name, pstate)
+                items.append((name, (pstate, base.x, base.y), self._picker_rect(name, pstate, base),
+                              partial(self.draw_picker, name=name, state=pstate, base=base)))
+        for name in state.loader_names:
+            lstate = state.states[name]
+            base = state.get_loader_position(name, lstate)
+            items.append((name, (lstate, base.x, base.y), self._loader_rect(lstate, base),
+                          partial(self.draw_loader, name=name, lstate=lstate, base=base)))
+
+        # Event log, metrics and the replay timeline
+        items.append(('log', tuple(log), LOG_RECT, partial(self.draw_event_log, log=log)))
+        if self.metrics is not None:
+            # (the panel only changes when the metrics close a sample)
+            items.append(('metrics', self.metrics.version, METRICS_RECT, self.draw_metrics))
+        if timeline is not None:
+            position, count, marks = timeline
+            bar = TIMELINE_RECT
+            rect = bar.inflate(10, 28).move(0, -7).union(bar.inflate(bar.height + 6, bar.height))
+            items.append(('timeline', (position, count), rect,
+                          partial(self.draw_timeline, position=position, count=count, marks=marks)))
+        return items + tooltip  # (on top of everything)
+
+    def draw_all(self, screen, speed_index, log, paused=False, frame_ms=None, timeline=None, hover=None):
         """Draw the complete UI"""
-        # 1. Draw background
-        self.draw_background(screen)
-        
-        # 2. Draw header and controls
-        self.draw_header(screen, speed_index)
-        
-        # 3. Draw simulation elements
-        self.draw_tree(screen)
-        self.draw_crate(screen)
-        self.draw_truck(screen)
-        
-        # 4. Draw actors
-        self.draw_pickers(screen)
-        self.draw_loader(screen)
-        
-        # 5. Draw event log
-        self.draw_event_log(screen, log)
+        # 1. Background, title, images and the empty crate, composited on the first frame
+        if self.static_layer is None:
+            self.static_layer = self.build_static_layer(screen)
+        screen.blit(self.static_layer, (0, 0))
+
+        # 2. Header, simulation elements, actors, log
+        items = self.items(speed_index, log, paused, frame_ms, timeline, hover)
+        for _, _, _, draw in items:
+            draw(screen)
+        self.previous = {name: (key, rect) for name, key, rect, _ in items}
+        self.changed = list(self.previous)
+
+    def draw_changed(self, screen, speed_index, log, paused=False, frame_ms=None, timeline=None, hover=None):
+        """
+        Redraw only where something changed since the previous frame: the old and new area of every item
+        whose key or position changed is restored from the static layer, every item touching it is drawn
+        again and the area is copied to the screen. Returns the rects to pass to pygame.display.update,
+        [] if nothing changed.
+        """
+        if self.previous is None:
+            self.draw_all(screen, speed_index, log, paused, frame_ms, timeline, hover)
+            return [screen.get_rect()]
+
+        items = self.items(speed_index, log, paused, frame_ms, timeline, hover)
+        dirty = []
+        self.changed = []
+        for name, key, rect, _ in items:
+            old = self.previous.get(name)
+            if old is None or old[0] != key or old[1] != rect:
+                self.changed.append(name)
+                dirty.append(rect)
+                if old is not None and old[1] != rect:
+                    dirty.append(old[1])
+        if not dirty:
+            return []
+
+        # a lot of small areas cost more than one full redraw
+        dirty_area = sum(r.width * r.height for r in dirty)
+        if len(dirty) > MAX_DIRTY_RECTS or dirty_area > screen.get_width() * screen.get_height() // 2:
+            self.draw_all(screen, speed_index, log, paused, frame_ms, timeline, hover)
+            return [screen.get_rect()]
+
+        # the items are drawn whole on a scratch canvas and only the area is copied - drawing them on the
+        # screen clipped to it is not an option, pygame outlines a clipped draw.rect along the clip edge
+        if self.canvas is None:
+            self.canvas = screen.copy()
+        rects = [rect for _, _, rect, _ in items]
+        for area in dirty:
+            self.canvas.blit(self.static_layer, area, area)
+            for i in area.collidelistall(rects):
+                items[i][3](self.canvas)
+            screen.blit(self.canvas, area, area)
+        self.previous = {name: (key, rect) for name, key, rect, _ in items}
+        return dirty
         
     def take_screenshot(self, screen, filename):
         """Take a screenshot of the current screen and save it to a file"""
@@ -287,8 +564,8 @@ class UIRenderer:
                        (panel_x, panel_y, panel_width, panel_height), 3)
         
         # Create a large header font
-        summary_font = pygame.font.SysFont(None, 36, bold=True)
-        info_font = pygame.font.SysFont(None, 24)
+        summary_font = self.font(36, bold=True)
+        info_font = self.font(24)
         
         # Draw summary title
         title_text = "Simulation Complete - Final Results"
@@ -321,7 +598,7 @@ class UIRenderer:
         screen.blit(crates_rendered, (panel_x + 300, info_y + line_spacing))
         
         # Current crate status
-        filled_slot_count = sum(1 for slot in self.state.crate_slots if slot > 0)
+        filled_slot_count = self.state.crate_count
         if filled_slot_count > 0:
             crate_text = f"Current Crate: {filled_slot_count}/{self.state.capacity} fruits"
             crate_rendered = info_font.render(crate_text, True, BLACK)
@@ -331,4 +608,101 @@ class UIRenderer:
         key_text = "Screenshot saved - Press any key to continue"
         key_rendered = info_font.render(key_text, True, RED)
         screen.blit(key_rendered, (panel_x + (panel_width - key_rendered.get_width()) // 2, 
-                                 panel_y + panel_height - 40))
\ No newline at end of file
+                                 panel_y + panel_height - 40))
+
+
+def fruit_sprite(radius):
+    """A fruit as draw_tree used to draw it with three circles, shadow included, centered at (radius, radius)"""
+    sprite = pygame.Surface((radius * 2 + 3, radius * 2 + 3), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, (100, 100, 100), (radius + 2, radius + 2), radius)
+    pygame.draw.circle(sprite, YELLOW, (radius, radius), radius)
+    pygame.draw.circle(sprite, ORANGE, (radius, radius), radius, 1)
+    return sprite
+
+
+def draw_sparkline(screen, rect, values, color, top=None):
+    """A line of the values over rect, oldest left, scaled to top (the largest value if None)"""
+    pygame.draw.rect(screen, (230, 240, 255), rect)
+    if len(values) < 2:
+        return
+    top = top or max(values) or 1.0
+    step = rect.width / (SPARKLINE_POINTS - 1)
+    points = [(rect.x + i * step, rect.bottom - 1 - (rect.height - 2) * min(value / top, 1.0))
+              for i, value in enumerate(values)]
+    pygame.draw.lines(screen, color, False, points)
+
+
+def picker_dot(color):
+    """A grouped picker, a small version of draw_picker's circle"""
+    size = PICKER_DOT_SPACING
+    dot = pygame.Surface((size, size), pygame.SRCALPHA)
+    radius = size // 2 - 1
+    pygame.draw.circle(dot, (100, 100, 100), (size // 2, size // 2), radius)
+    pygame.draw.circle(dot, color, (size // 2 - 1, size // 2 - 1), radius)
+    return dot
+
+
+class FruitDensity:
+    """
+    Fruits per DENSITY_CELL square of one tree, drawn as one small surface scaled up: yellow where the
+    tree is thin, deep orange where it is as full as its fullest cell was at the start.
+    The counts follow the remaining fruits (a prefix of the position buffers) by adding or removing
+    only the fruits in between, so a frame costs the change plus the tree's area, whatever the fruit count.
+    """
+    def __init__(self, xs, ys):
+        self.x0, self.y0 = min(xs), min(ys)
+        self.cols = (max(xs) - self.x0) // DENSITY_CELL + 1
+        self.rows = (max(ys) - self.y0) // DENSITY_CELL + 1
+        if np is not None:
+            self.cells = ((ys - self.y0) // DENSITY_CELL).astype(np.int32) * self.cols + (xs - self.x0) // DENSITY_CELL
+            self.counts = np.bincount(self.cells, minlength=self.cols * self.rows)
+            self.full = int(self.counts.max())
+        else:
+            self.cells = array('i', ((y - self.y0) // DENSITY_CELL * self.cols + (x - self.x0) // DENSITY_CELL
+                                     for x, y in zip(xs, ys)))
+            self.counts = [0] * (self.cols * self.rows)
+            for cell in self.cells:
+                self.counts[cell] += 1
+            self.full = max(self.counts)
+        self.remaining = len(self.cells)
+        self.surface = None
+
+    def update(self, remaining):
+        """Follow the remaining count, down while the run goes on, up after seeking back in a replay"""
+        low, high = sorted((remaining, self.remaining))
+        if low == high:
+            return
+        sign = -1 if remaining < self.remaining else 1
+        if np is not None:
+            self.counts += sign * np.bincount(self.cells[low:high], minlength=len(self.counts))
+        else:
+            for cell in self.cells[low:high]:
+                self.counts[cell] += sign
+        self.remaining = remaining
+        self.surface = None
+
+    def draw(self, screen, remaining):
+        self.update(remaining)
+        if self.surface is None:
+            self.surface = self._render()
+        screen.blit(self.surface, (self.x0, self.y0))
+
+    def _render(self):
+        empty = (255, 0, 255)  # colorkey, cells without fruit stay transparent
+        deep = (200, 90, 0)
+        if np is not None:
+            share = np.minimum(self.counts / max(1, self.full), 1.0).reshape(self.rows, self.cols, 1)
+            rgb = np.array(YELLOW) + (np.array(deep) - np.array(YELLOW)) * share
+            rgb[self.counts.reshape(self.rows, self.cols) == 0] = empty
+            small = pygame.surfarray.make_surface(rgb.astype(np.uint8).transpose(1, 0, 2))
+        else:
+            small = pygame.Surface((self.cols, self.rows))
+            small.fill(empty)
+            for cell, count in enumerate(self.counts):
+                if count:
+                    share = min(count / self.full, 1.0)
+                    small.set_at((cell % self.cols, cell // self.cols),
+                                 [int(a + (b - a) * share) for a, b in zip(YELLOW, deep)])
+        surface = pygame.transform.scale(small, (self.cols * DENSITY_CELL, self.rows * DENSITY_CELL))
+        surface.set_colorkey(empty)
+        return surface
@@ -1,47 +1,199 @@
+import heapq
 import multiprocessing as mp
+from multiprocessing.connection import wait
+from multiprocessing.managers import SyncManager
 import random
+import sys
+import time
 from colorama import Fore, Back, Style, init
+from events import Event, EVENT_FORMATS, format_state, make_writer, pack_record, unpack_record
 
 # Initialize colorama
 init(autoreset=True)
 
+BACKENDS = ('manager', 'shm')
+
+EVENT_SLACK = 0.05  # seconds the EventMerger waits on quiet pipes before it looks at the idle flags again
+EVENT_BATCH = 256  # records the EventMerger writes between two reads of the pipes
+EVENT_HEAP_LIMIT = 65536  # records the EventMerger holds before it stops reading the pipes (and the actors wait)
+
+
+class FruitTree:
+    """
+    Fruit ids with O(1) random removal: swap with the tail, then shrink.
+    Lives inside the OrchardManager server process for the manager backend.
+    """
+    def __init__(self, fruit_ids, seed=None):
+        self.ids = list(fruit_ids)
+        self.random = random.Random(seed)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def pop_random(self):
+        # one round trip instead of len() + pop(), None once the tree is empty
+        if not self.ids:
+            return None
+        idx = self.random.randrange(len(self.ids))
+        self.ids[idx], self.ids[-1] = self.ids[-1], self.ids[idx]
+        fruit = self.ids.pop()
+        return fruit, fruit
+
+    def pop_batch(self, count):
+        # up to count random fruits in one round trip, [] once the tree is empty
+        fruits = []
+        while len(fruits) < count and self.ids:
+            fruits.append(self.pop_random())
+        return fruits
+
+
+class OrchardManager(SyncManager):
+    """
+    SyncManager that can also host a FruitTree.
+    """
+
+
+OrchardManager.register('FruitTree', FruitTree, exposed=('__len__', 'pop_random', 'pop_batch'))
+
+
+class ShmFruitTree:
+    """
+    Fixed-size tree of fruit ids in shared memory. Guarded by its tree lock.
+    """
+    def __init__(self, fruit_ids):
+        fruit_ids = list(fruit_ids)
+        self.ids = mp.RawArray('i', fruit_ids)
+        self.length = mp.RawValue('i', len(fruit_ids))
+
+    def __len__(self):
+        return self.length.value
+
+    def pop_random(self):
+        # move the tail fruit into the hole and decrement the shared length
+        n = self.length.value
+        if n == 0:
+            return None
+        idx = random.randrange(n)
+        fruit = self.ids[idx]
+        self.ids[idx] = self.ids[n - 1]
+        self.length.value = n - 1
+        return fruit, fruit
+
+    def pop_batch(self, count):
+        fruits = []
+        while len(fruits) < count and self.length.value:
+            fruits.append(self.pop_random())
+        return fruits
+
+
+class ShmCrate:
+    """
+    Fixed-size crate of fruit ids in shared memory. Guarded by crate_lock.
+    """
+    def __init__(self, crate_capacity):
+        self.ids = mp.RawArray('i', crate_capacity)
+        self.length = mp.RawValue('i', 0)
+
+    def __len__(self):
+        return self.length.value
+
+    def __iter__(self):
+        for fruit in self.ids[:self.length.value]:
+            yield fruit, fruit
+
+    def append(self, fruit):
+        fruit_idx, _ = fruit
+        self.ids[self.length.value] = fruit_idx
+        self.length.value += 1
+
+    def __delitem__(self, key):
+        # the Loader only ever empties the whole crate (del crate[:])
+        if key != slice(None):
+            raise TypeError("ShmCrate only supports del crate[:]")
+        self.length.value = 0
+
+
+def tree_fruit_ids(num_fruits, num_trees, tree):
+    """
+    Fruit ids growing on one tree, fruits are dealt round robin over the trees.
+    """
+    return range(tree + 1, num_fruits + 1, num_trees)
+
+
 class SharedResources:
     """
     Encapsulates shared state and synchronization primitives.
-    """
-    def __init__(self, num_fruits, crate_capacity, process_names, header_line, separator):
-        manager = mp.Manager()
 
-        # printing wali cheez hai nothing important
-        self.process_names = process_names
-        self.header_line = header_line
-        self.separator = separator
+    backend='manager' keeps the containers in mp.Manager() proxies,
+    backend='shm' keeps them in fixed-size shared memory buffers (no server process).
+    With num_crates > 1 pickers keep filling a fresh crate while full ones wait in the full_crates queue.
+    With num_trees > 1 the fruits are split over several trees, each behind its own lock.
+    With a contention.Contention every actor times its primitives, see instrument().
+    """
+    def __init__(self, num_fruits, crate_capacity, backend='manager', num_crates=1, num_trees=1, contention=None,
+                 seed=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.contention = contention
+        self.seed = seed  # seeds which fruits get picked, the scheduling stays up to the OS
 
-        # Shared containers - store (index, value) pairs for fruits
-        self.tree = manager.list([(i, i) for i in range(1, num_fruits + 1)])
-        self.crate = manager.list()
+        if backend == 'shm':
+            # Shared containers - fruit ids, the value of fruit i is i
+            self.trees = [ShmFruitTree(tree_fruit_ids(num_fruits, num_trees, t)) for t in range(num_trees)]
+            self.crates = [ShmCrate(crate_capacity) for _ in range(num_crates)]
+        else:
+            manager = OrchardManager()
+            manager.start()
 
-        # Previous states for color highlighting
-        self.prev_states = manager.dict({name: 'idle' for name in process_names})
+            # Shared containers - fruits come out as (index, value) pairs
+            tree_seeds = [None if seed is None else f"{seed}:{t}" for t in range(num_trees)]
+            self.trees = [manager.FruitTree(tree_fruit_ids(num_fruits, num_trees, t), tree_seeds[t])
+                          for t in range(num_trees)]
+            self.crates = [manager.list() for _ in range(num_crates)]
 
         # Synchronization primitives
-        self.tree_lock = mp.Lock()  # locks take care of mutual exclusion
+        self.tree_locks = [mp.Lock() for _ in range(num_trees)]  # locks take care of mutual exclusion
+        # fruits left per tree, written under that tree's lock and read without it to pick a tree to steal from
+        self.tree_occupancy = mp.RawArray('i', [len(tree_fruit_ids(num_fruits, num_trees, t)) for t in range(num_trees)])
         self.crate_lock = mp.Lock()
-        self.slots_sem = mp.Semaphore(crate_capacity) # semaphore to limit the number of fruits in the crate
-        self.full_crate_sem = mp.Semaphore(0) # semaphore to signal that the crate is full
+        self.slots_sem = mp.Semaphore(crate_capacity * num_crates) # semaphore to limit the number of fruits in the crates
 
-        # Printing lock (When multiple processes all do print() at the same time, their output can get interleaved on the console, producing jumbled lines )
-        self.print_lock = mp.Lock()
+        # Crate handoff - full crates queue up for the loader, emptied ones come back for the pickers.
+        # Only num_crates ids ever circulate so both queues stay bounded. None in full_crates means the pickers are done.
+        self.full_crates = mp.SimpleQueue()
+        self.empty_crates = mp.SimpleQueue()
+        for idx in range(1, num_crates):
+            self.empty_crates.put(idx)
+        self.active_crate = mp.Value('i', 0) # crate the pickers are filling, -1 while they need a fresh one
 
-        # Termination flag
-        self.done = mp.Value('b', False)
-
-        # Crate counter  - takes care of empty slots
+        # Crate counter  - takes care of empty slots of the active crate
         self.crate_count = mp.Value('i', 0)
         self.crate_capacity = crate_capacity # (12)
 
-        # Process states - for printing
-        self.states = manager.dict({name: 'idle' for name in process_names})
+
+def primitive_names(num_trees):
+    """
+    Names the contention report uses for the synchronization primitives.
+    """
+    trees = ['tree_lock'] if num_trees == 1 else [f"tree_lock {t + 1}" for t in range(num_trees)]
+    return trees + ['crate_lock', 'slots_sem', 'full_crates', 'empty_crates']
+
+
+def instrument(resources, actor):
+    """
+    Swap this process's copy of the primitives for timed wrappers recording as actor.
+    Call at the top of run(), does nothing without a contention object.
+    """
+    contention = resources.contention
+    if contention is None:
+        return
+    names = primitive_names(len(resources.tree_locks))
+    resources.tree_locks = [contention.wrap(lock, actor, name) for lock, name in zip(resources.tree_locks, names)]
+    resources.crate_lock = contention.wrap(resources.crate_lock, actor, 'crate_lock')
+    resources.slots_sem = contention.wrap(resources.slots_sem, actor, 'slots_sem', hold=False)
+    resources.full_crates = contention.wrap_queue(resources.full_crates, actor, 'full_crates')
+    resources.empty_crates = contention.wrap_queue(resources.empty_crates, actor, 'empty_crates')
 
 
 def get_state_color(state):
@@ -64,125 +216,425 @@ def get_state_color(state):
         return Fore.WHITE
 
 
-def print_event(active, message, resources):
-    """
-    Update active state and print a snapshot of all process states with color.
-    """
-    with resources.print_lock:
-        # Store previous state and update current state
-        resources.prev_states[active] = resources.states.get(active, 'idle')
-        resources.states[active] = message
-        
-        # Format columns with appropriate colors
-        cols = []
-        for name in resources.process_names:
-            state = resources.states[name]
-            # Highlight the active process with a different background
-            if name == active:
-                col_text = Back.BLUE + Fore.WHITE + Style.BRIGHT + f"{state:^15}" + Style.RESET_ALL
-            else:
-                # Color based on state
-                color = get_state_color(state)
-                col_text = color + f"{state:^15}"
-            cols.append(col_text)
-        
-        print(" | ".join(cols))
-        print(Fore.WHITE + Style.DIM + resources.separator)
+def print_event(conn, event, fruit=0, slot=0, crate=-1, tree=-1, fruits=()):
+    """
+    Record one state transition of the calling process (see events.Event for the fields).
+    The record goes down the process's own event pipe, no lock and no terminal on the way - the EventMerger
+    orders, numbers and writes it. Without a pipe (output='none') there is nothing to do.
+    """
+    if conn is None:
+        return
+    conn.send_bytes(pack_record(time.monotonic(), event, fruit, slot, crate, tree, fruits))
+
+
+class IdleFlag:
+    """
+    One actor's byte in the idle array the EventMerger reads. `with flag:` around a call that may block
+    (or a sleep) tells the merger that whatever the actor sends next is stamped after it looked, so the
+    actor does not hold the other records back while it waits. flags=None (no merger) does nothing.
+    """
+    def __init__(self, flags, index):
+        self.flags = flags
+        self.index = index
+
+    def __enter__(self):
+        if self.flags is not None:
+            self.flags[self.index] = 1
+
+    def __exit__(self, *exc):
+        if self.flags is not None:
+            self.flags[self.index] = 0
+
+
+def print_row(process_names, states, active, separator):
+    """
+    Print a snapshot of all process states with color, the active process highlighted.
+    """
+    # Format columns with appropriate colors
+    cols = []
+    for name in process_names:
+        state = states[name]
+        # Highlight the active process with a different background
+        if name == active:
+            col_text = Back.BLUE + Fore.WHITE + Style.BRIGHT + f"{state:^15}" + Style.RESET_ALL
+        else:
+            # Color based on state
+            color = get_state_color(state)
+            col_text = color + f"{state:^15}"
+        cols.append(col_text)
+    
+    print(" | ".join(cols))
+    print(Fore.WHITE + Style.DIM + separator)
+
+
+class TableSink:
+    """
+    Event sink printing the console table. With every > 1 only every Nth snapshot is printed, with an
+    interval one snapshot per interval seconds of event time - plus the final one either way.
+    States are still tracked for every event, the colored rendering only happens for printed rows.
+    """
+    def __init__(self, process_names, separator, num_trees=1, every=1, interval=None):
+        self.process_names = process_names
+        self.separator = separator
+        self.num_trees = num_trees
+        self.every = every
+        self.interval = interval
+        self.states = {name: 'idle' for name in process_names}
+        self.running = len(process_names)  # actors that have not sent 'exiting' yet
+        self.count = 0
+        self.next_ts = None
+
+    def __call__(self, event):
+        self.states[event.actor] = format_state(event, self.num_trees)
+        self.count += 1
+        if event.event == 'exiting':
+            self.running -= 1
+        if self.interval:
+            if self.next_ts is None:
+                self.next_ts = event.ts
+            due = event.ts >= self.next_ts
+            if due:
+                self.next_ts = event.ts + self.interval
+        else:
+            due = self.count % self.every == 0
+        if due or not self.running:
+            print_row(self.process_names, self.states, event.actor, self.separator)
+
+
+class SummarySink:
+    """
+    Event sink printing one plain line of totals per interval seconds of event time and a report at the end,
+    no table at all.
+    """
+    def __init__(self, process_names, num_fruits, num_crates=1, interval=1.0):
+        self.num_fruits = num_fruits
+        self.num_crates = num_crates
+        self.interval = interval
+        self.running = len(process_names)
+        self.picks = {name: 0 for name in process_names if name.startswith('Picker')}
+        self.waiting = {'waiting tree': 0, 'waiting slot': 0, 'waiting crate': 0}
+        self.last = {}  # actor -> its current event
+        self.events = 0
+        self.stored = 0
+        self.loaded = 0
+        self.crates = 0  # crates delivered, the partial one included
+        self.partial = 0
+        self.full = 0  # crates waiting for a loader
+        self.loading = 0  # crates on a truck
+        self.filling = 1  # the active crate, 0 between 'crate full' and the next store
+        self.start = None
+        self.next_ts = None
+
+    def __call__(self, event):
+        kind = event.event
+        self.events += 1
+        if self.start is None:
+            self.start = event.ts
+            self.next_ts = event.ts + self.interval
+        previous = self.last.get(event.actor)
+        if previous in self.waiting:
+            self.waiting[previous] -= 1
+        if kind in self.waiting:
+            self.waiting[kind] += 1
+        self.last[event.actor] = kind
+
+        if kind == 'picked':
+            self.picks[event.actor] += 1
+        elif kind == 'stored':
+            self.stored += 1
+            self.filling = 1
+        elif kind == 'crate full':
+            self.full += 1
+            self.filling = 0
+        elif kind == 'got full':
+            self.full -= 1
+            self.loading += 1
+        elif kind == 'loading':
+            self.loaded += event.slot
+            self.crates += 1
+        elif kind == 'emptied crate':
+            self.loading -= 1
+        elif kind == 'partial':
+            self.loaded += event.slot
+            self.crates += 1
+            self.partial = event.slot
+        elif kind == 'exiting':
+            self.running -= 1
+
+        if not self.running:
+            self.print_line(event.ts)
+            self.print_report(event.ts)
+        elif event.ts >= self.next_ts:
+            self.next_ts = event.ts + self.interval
+            self.print_line(event.ts)
+
+    def print_line(self, ts):
+        empty = self.num_crates - self.filling - self.full - self.loading
+        print(f"[{ts - self.start:9.2f}s] picked {sum(self.picks.values())}/{self.num_fruits} stored {self.stored} "
+              f"loaded {self.loaded} | crates {self.crates} | queued full {self.full} empty {empty} | "
+              f"waiting tree {self.waiting['waiting tree']} slot {self.waiting['waiting slot']} "
+              f"crate {self.waiting['waiting crate']}", flush=True)
+
+    def print_report(self, ts):
+        elapsed = ts - self.start
+        picks = list(self.picks.values())
+        print(f"Summary: {self.loaded} of {self.num_fruits} fruits loaded in {elapsed:.2f}s"
+              f" ({self.loaded / elapsed if elapsed else 0:.1f} fruits/s), {self.events} events")
+        print(f"Crates: {self.crates} delivered" + (f", the last one partial with {self.partial}" if self.partial else ""))
+        print(f"Picks per picker: min {min(picks)} max {max(picks)} mean {sum(picks) / len(picks):.1f}", flush=True)
+
+
+OUTPUTS = ('full', 'sampled', 'summary', 'none')
+
+
+def event_sink(events, process_names, separator, num_trees=1, event_queue=None, output='full', every=100,
+               interval=None, num_fruits=0, num_crates=1):
+    """
+    Where the Event records of a run go: the event queue if there is one, else the table (every row,
+    sampled rows or the summary) or a jsonl/binary writer on stdout (the header is written by run_orchard).
+    output='none' has no sink at all, the actors do not even send their records.
+    """
+    if event_queue is not None:
+        return event_queue.put
+    if output in ('sampled', 'summary') and events != 'table':
+        raise ValueError(f"output {output!r} prints text, it needs events='table'")
+    if output == 'summary':
+        return SummarySink(process_names, num_fruits, num_crates, interval or 1.0)
+    if output == 'sampled':
+        return TableSink(process_names, separator, num_trees, every, interval)
+    if events == 'table':
+        return TableSink(process_names, separator, num_trees)
+    return make_writer(events, sys.stdout.buffer, process_names).write
+
+
+class EventMerger(mp.Process):
+    """
+    The one process that writes events. Every actor sends records down its own pipe, in its own time order.
+    A record is final once every open pipe has sent something as new, or its actor is blocked: idle (its
+    IdleFlag set when the merger looked) with its pipe read empty. Then it gets its seq and goes to the sink
+    built from sink_options (see event_sink). Time alone never lets a record go, a preempted actor holds
+    everything newer back until its records arrive.
+    Past EVENT_HEAP_LIMIT held records only the pipe holding back the oldest ones is read, the others fill up
+    and their actors wait, so a slow reader of the output slows the run down instead of growing the heap.
+    """
+    def __init__(self, conns, sink_options, senders=(), idle=None):
+        super().__init__(name='EventMerger')
+        if sink_options.get('events', 'table') not in EVENT_FORMATS:
+            raise ValueError(f"unknown event format {sink_options['events']!r}, expected one of {EVENT_FORMATS}")
+        self.conns = conns  # actor name -> receiving end of its pipe
+        self.sink_options = sink_options
+        # sending ends of the same pipes - a forked merger inherits them and would never see a pipe close
+        self.senders = senders
+        self.idle = idle  # the actors' IdleFlag array, in the order of conns
+
+    def run(self):
+        for conn in self.senders:
+            conn.close()
+        names = {conn: name for name, conn in self.conns.items()}
+        flags = {conn: i for i, conn in enumerate(self.conns.values())}  # conn -> its index in self.idle
+        newest = {conn: float('-inf') for conn in names}  # last ts per open pipe
+        heap = []
+        order = 0  # tie breaker, records of one actor keep their order
+        sink = event_sink(**self.sink_options)
+        seq = 0
+
+        timeout = EVENT_SLACK
+        while newest or heap:
+            # the clock and the flags are read before the pipes: an actor idle now sent everything stamped
+            # earlier already, and stamps its next record after it clears its flag, so later than now
+            now = time.monotonic()
+            idle = self.idle[:] if self.idle is not None else None
+            lagging = min(newest.values(), default=None)
+            full = len(heap) >= EVENT_HEAP_LIMIT
+            held = []  # newest record of every pipe left with records in it
+            read = 0
+            for conn in wait(list(newest), timeout) if newest else ():
+                if full and newest[conn] > lagging:
+                    held.append(newest[conn])  # not read, its actor waits once the pipe is full
+                    continue
+                try:
+                    while conn.poll():
+                        ts, event, fruit, slot, crate, tree, fruits = unpack_record(conn.recv_bytes())
+                        order += 1
+                        heapq.heappush(heap, (ts, order, names[conn], event, fruit, slot, crate, tree, fruits))
+                        newest[conn] = ts
+                        read += 1
+                        # a full heap still takes what the oldest records wait for, up to one record past it
+                        if len(heap) >= EVENT_HEAP_LIMIT and ts > lagging:
+                            held.append(ts)
+                            break
+                except EOFError:
+                    # the actor exited and everything it sent is in the heap
+                    del newest[conn]
+
+            watermark = min((now if idle and idle[flags[conn]] else ts for conn, ts in newest.items()),
+                            default=float('inf'))
+            if held:
+                # (records still in a pipe are newer than the last one read from it, idle actor or not)
+                watermark = min(watermark, min(held))
+            written = 0
+            while heap and heap[0][0] <= watermark and written < EVENT_BATCH:
+                ts, _, actor, event, fruit, slot, crate, tree, fruits = heapq.heappop(heap)
+                seq += 1
+                sink(Event(seq, ts, actor, event, fruit, slot, crate, tree, fruits))
+                written += 1
+            if written:
+                sys.stdout.flush()
+            elif full and not read:
+                time.sleep(0.001)  # nothing to take or write until the lagging actor sends or blocks
+            # (more than a batch was final, write the rest right away)
+            timeout = 0 if written == EVENT_BATCH else EVENT_SLACK
 
 
 class Picker(mp.Process):
     """
     Picks fruits from the tree and stores them into the crate.
+    With batch > 1 it takes up to batch fruits per tree visit and stores as many per crate visit.
+    With several trees it picks from its home tree and steals from the fullest one once that is bare.
     """
-    def __init__(self, picker_id, resources: SharedResources):
+    def __init__(self, picker_id, resources: SharedResources, event_conn, batch=1, idle=None):
         super().__init__(name=f"Picker-{picker_id}")
         self.res = resources
+        self.event_conn = event_conn  # sending end of this picker's event pipe, None to send nothing
+        self.idle = idle or IdleFlag(None, 0)  # set while it blocks, see EventMerger
+        self.batch = batch
+        self.home_tree = (picker_id - 1) % len(resources.trees)
+
+    def choose_tree(self):
+        """
+        Home tree while it has fruit, otherwise the fullest tree.
+        """
+        occupancy = self.res.tree_occupancy
+        if occupancy[self.home_tree] > 0:
+            return self.home_tree
+        return max(range(len(occupancy)), key=occupancy.__getitem__)
 
     def run(self):
+        instrument(self.res, self.name)
+        if self.res.seed is not None:
+            random.seed(f"{self.res.seed}:{self.name}")  # ShmFruitTree pops with this process's random
         while True:
+            tree = self.choose_tree()
+
             # Tree lock acquire - always block for fairness
-            print_event(self.name, 'waiting tree', self.res)
-            self.res.tree_lock.acquire()
+            print_event(self.event_conn, 'waiting tree', tree=tree)
+            with self.idle:
+                self.res.tree_locks[tree].acquire()
             # Now acquired
-            print_event(self.name, 'acquired tree', self.res)
+            print_event(self.event_conn, 'acquired tree', tree=tree)
             try:
-                # if tree empty, exit
-                if not self.res.tree:
+                # Pop random fruits (index, value pairs), if the whole orchard is empty, exit
+                fruits = self.res.trees[tree].pop_batch(self.batch)
+                self.res.tree_occupancy[tree] -= len(fruits)
+                if not fruits and not any(self.res.tree_occupancy):
                     break
-                # Pop random fruit (index, value pair)
-                random_idx = random.randrange(len(self.res.tree))
-                fruit_idx, fruit_val = self.res.tree.pop(random_idx)
-                print_event(self.name, f'picked #{fruit_idx}:{fruit_val}', self.res)
+                # (no fruits but some left elsewhere - another picker emptied this tree first, choose again)
+                for fruit_idx, fruit_val in fruits:
+                    print_event(self.event_conn, 'picked', fruit=fruit_idx, tree=tree)
             finally:
                 # release teh lock
-                self.res.tree_lock.release()
+                self.res.tree_locks[tree].release()
 
-            # Slot semaphore acquire - always block for fairness
-            print_event(self.name, 'waiting slot', self.res)
-            self.res.slots_sem.acquire()
-            print_event(self.name, 'got slot', self.res)
+            while fruits:
+                # Slot semaphore acquire - always block for fairness
+                print_event(self.event_conn, 'waiting slot')
+                with self.idle:
+                    self.res.slots_sem.acquire()
+                # take more slots for the rest of the batch only if they are free right now,
+                # blocking while holding slots that are not stored yet could deadlock the crate
+                slots = 1
+                while slots < len(fruits) and self.res.slots_sem.acquire(False):
+                    slots += 1
+                print_event(self.event_conn, 'got slot')
 
-            # Crate lock acquire - always block for fairness
-            print_event(self.name, 'waiting crate', self.res)
-            self.res.crate_lock.acquire()
-            print_event(self.name, 'acquired crate', self.res)
-            try:
-                # add fruit (index, value) to crate
-                self.res.crate.append((fruit_idx, fruit_val))
-                slot = self.res.crate_count.value + 1
-                self.res.crate_count.value = slot
-                print_event(self.name, f'stored #{fruit_idx} in {slot}', self.res)
-                # check if crate is full
-                if slot == self.res.crate_capacity:
-                    print_event(self.name, 'crate full', self.res)
-                    self.res.full_crate_sem.release()
-            finally:
-                self.res.crate_lock.release()
+                # Crate lock acquire - always block for fairness
+                print_event(self.event_conn, 'waiting crate')
+                with self.idle:
+                    self.res.crate_lock.acquire()
+                print_event(self.event_conn, 'acquired crate')
+                try:
+                    for fruit_idx, fruit_val in fruits[:slots]:
+                        # last crate went to the loader - holding a slot guarantees an empty one is queued
+                        if self.res.active_crate.value < 0:
+                            with self.idle:
+                                self.res.active_crate.value = self.res.empty_crates.get()
+                        # add fruit (index, value) to crate
+                        crate = self.res.active_crate.value
+                        self.res.crates[crate].append((fruit_idx, fruit_val))
+                        slot = self.res.crate_count.value + 1
+                        self.res.crate_count.value = slot
+                        print_event(self.event_conn, 'stored', fruit=fruit_idx, slot=slot, crate=crate)
+                        # check if crate is full, hand it over to the loader
+                        if slot == self.res.crate_capacity:
+                            print_event(self.event_conn, 'crate full', crate=crate)
+                            self.res.full_crates.put(crate)
+                            self.res.active_crate.value = -1
+                            self.res.crate_count.value = 0
+                finally:
+                    self.res.crate_lock.release()
+                fruits = fruits[slots:]
 
-        print_event(self.name, 'exiting', self.res)
+        print_event(self.event_conn, 'exiting')
 
 
 class Loader(mp.Process):
     """
     Waits for full or final crates and loads them.
+    Crates are taken off the full_crates queue, so loading does not hold the crate lock
+    and any number of loaders can share the queue.
     """
-    def __init__(self, resources: SharedResources):
-        super().__init__(name='Loader')
+    def __init__(self, resources: SharedResources, event_conn, load_delay=0.0, loader_id=None, idle=None):
+        super().__init__(name='Loader' if loader_id is None else f"Loader-{loader_id}")
         self.res = resources
+        self.event_conn = event_conn  # sending end of this loader's event pipe, None to send nothing
+        self.idle = idle or IdleFlag(None, 0)  # set while it blocks or loads, see EventMerger
+        self.load_delay = load_delay  # seconds the truck takes per crate
 
     def run(self):
+        instrument(self.res, self.name)
         while True:
-            print_event('Loader', 'waiting full', self.res)
-            # Wait for a full crate 
-            self.res.full_crate_sem.acquire()
-            print_event('Loader', 'got full', self.res)
-
-            # Crate lock acquire - always block for fairness
-            print_event('Loader', 'waiting crate', self.res)
-            self.res.crate_lock.acquire()
-            print_event('Loader', 'acquired crate', self.res)
-            try:
-                # if done, see if partial hain ya nh
-                if self.res.done.value:
+            print_event(self.event_conn, 'waiting full')
+            # Wait for a full crate
+            with self.idle:
+                idx = self.res.full_crates.get()
+
+            # pickers are done (one None per loader), see if partial hain ya nh
+            if idx is None:
+                # Crate lock acquire - always block for fairness
+                print_event(self.event_conn, 'waiting crate')
+                with self.idle:
+                    self.res.crate_lock.acquire()
+                print_event(self.event_conn, 'acquired crate')
+                try:
                     if self.res.crate_count.value > 0:
-                        fruit_indices = [f"#{idx}" for idx, _ in self.res.crate]
-                        print_event('Loader', f'partial {self.res.crate_count.value} {",".join(fruit_indices)}', self.res)
-                    print_event('Loader', 'exiting', self.res)
-                    break
-                
-                cnt = self.res.crate_count.value
-                fruit_indices = [f"#{idx}" for idx, _ in self.res.crate]
-                print_event('Loader', f'loading {cnt} {",".join(fruit_indices)}', self.res)
-
-                # empty the crate
-                self.res.crate[:] = []
-                self.res.crate_count.value = 0
-                print_event('Loader', 'emptied crate', self.res)
-            finally:
-                self.res.crate_lock.release()
+                        crate = self.res.active_crate.value
+                        fruits = [i for i, _ in self.res.crates[crate]]
+                        print_event(self.event_conn, 'partial', slot=len(fruits), crate=crate, fruits=fruits)
+                        # claim it so the other loaders exit without reporting it again
+                        self.res.crate_count.value = 0
+                    print_event(self.event_conn, 'exiting')
+                finally:
+                    self.res.crate_lock.release()
+                break
+
+            print_event(self.event_conn, 'got full', crate=idx)
+
+            # the crate is ours until it goes back to empty_crates
+            crate = self.res.crates[idx]
+            fruits = [i for i, _ in crate]
+            print_event(self.event_conn, 'loading', slot=len(fruits), crate=idx, fruits=fruits)
+            if self.load_delay:
+                with self.idle:
+                    time.sleep(self.load_delay)
+
+            # empty the crate
+            del crate[:]
+            print_event(self.event_conn, 'emptied crate', crate=idx)
+
+            # crate goes back before its slots do
+            self.res.empty_crates.put(idx)
 
             # Reset slots
             for _ in range(self.res.crate_capacity):
                 self.res.slots_sem.release()
-            print_event('Loader', 'reset slots', self.res)
-
+            print_event(self.event_conn, 'reset slots')
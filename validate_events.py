@@ -0,0 +1,121 @@
+import argparse
+import sys
+from events import Event, read_events
+
+MAX_REPORTED = 20  # violations printed, the rest are only counted
+
+
+class Validator:
+    """
+    Checks the invariants of a run while its events stream past:
+    every fruit picked once and then stored once, no crate over capacity, slots 1, 2, .. in every crate,
+    loading/partial hand over exactly what was stored, everything loaded, every actor ends in exiting.
+    Memory is one byte per fruit and the contents of the open crates.
+    """
+    def __init__(self, meta):
+        self.fruits = meta['fruits']
+        self.capacity = meta['capacity']
+        self.actors = meta['actors']
+        self.picked = bytearray(self.fruits + 1)  # 1 picked, 2 stored
+        self.crates = {}  # crate id -> fruit ids stored since it was last emptied
+        self.full = set()  # crates that reported 'crate full' and were not emptied yet
+        self.last = {}  # actor -> its latest event
+        self.loaded = 0
+        self.seq = 0
+        self.violations = []
+        self.count = 0
+
+    def fail(self, event, message):
+        self.count += 1
+        if len(self.violations) < MAX_REPORTED:
+            self.violations.append(f"seq {event.seq} {event.actor} {event.event}: {message}")
+
+    def feed(self, event):
+        kind = event.event
+        if event.seq <= self.seq:
+            self.fail(event, f"seq after {self.seq}")
+        self.seq = event.seq
+        if self.last.get(event.actor) == 'exiting':
+            self.fail(event, "event after exiting")
+        self.last[event.actor] = kind
+
+        if kind == 'picked':
+            if not 1 <= event.fruit <= self.fruits:
+                self.fail(event, f"no fruit #{event.fruit}")
+            elif self.picked[event.fruit]:
+                self.fail(event, f"fruit #{event.fruit} picked twice")
+            else:
+                self.picked[event.fruit] = 1
+        elif kind == 'stored':
+            if not 1 <= event.fruit <= self.fruits or self.picked[event.fruit] != 1:
+                self.fail(event, f"fruit #{event.fruit} stored without being picked, or twice")
+            else:
+                self.picked[event.fruit] = 2
+            crate = self.crates.setdefault(event.crate, [])
+            if event.crate in self.full:
+                self.fail(event, f"crate {event.crate} is full and not emptied yet")
+            crate.append(event.fruit)
+            if event.slot != len(crate):
+                self.fail(event, f"slot {event.slot}, expected {len(crate)}")
+            if len(crate) > self.capacity:
+                self.fail(event, f"crate {event.crate} holds {len(crate)} > capacity {self.capacity}")
+        elif kind == 'crate full':
+            if len(self.crates.get(event.crate, ())) != self.capacity:
+                self.fail(event, f"crate {event.crate} holds {len(self.crates.get(event.crate, ()))}")
+            self.full.add(event.crate)
+        elif kind in ('loading', 'partial'):
+            crate = self.crates.get(event.crate, [])
+            if kind == 'loading' and event.crate not in self.full:
+                self.fail(event, f"crate {event.crate} loaded before it was full")
+            if kind == 'partial' and not 0 < len(crate) < self.capacity:
+                self.fail(event, f"partial crate {event.crate} holds {len(crate)}")
+            if event.slot != len(crate):
+                self.fail(event, f"{event.slot} fruits handed over, crate {event.crate} holds {len(crate)}")
+            # (the binary format carries no fruit ids)
+            if event.fruits and sorted(event.fruits) != sorted(crate):
+                self.fail(event, f"fruits differ from what crate {event.crate} holds")
+            self.loaded += event.slot
+        elif kind == 'emptied crate':
+            self.crates[event.crate] = []
+            self.full.discard(event.crate)
+
+    def finish(self):
+        """Checks only the end of the run can tell, returns the violations"""
+        end = Event(self.seq, 0.0, '-', 'end', 0, 0, -1, -1)  # (what the violations below are reported at)
+        if self.loaded != self.fruits:
+            self.fail(end, f"{self.loaded} fruits loaded, expected {self.fruits}")
+        missing = self.picked.count(0) - 1  # (index 0 is not a fruit)
+        if missing:
+            self.fail(end, f"{missing} fruits never picked")
+        unstored = self.picked.count(1)
+        if unstored:
+            self.fail(end, f"{unstored} fruits picked but never stored")
+        for actor in self.actors:
+            if self.last.get(actor) != 'exiting':
+                self.fail(end, f"{actor} ended in {self.last.get(actor, 'nothing')!r}")
+        return self.violations
+
+
+def validate(meta, events):
+    """Run the validator over an event iterator, returns (violation count, first violations)"""
+    validator = Validator(meta)
+    for event in events:
+        validator.feed(event)
+    violations = validator.finish()
+    return validator.count, violations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the invariants of a jsonl or binary event log")
+    parser.add_argument("log", nargs="?", default="-", help="event log, - for stdin (default)")
+    args = parser.parse_args()
+
+    stream = sys.stdin.buffer if args.log == "-" else open(args.log, "rb")
+    with stream:
+        count, violations = validate(*read_events(stream))
+    for violation in violations:
+        print(violation)
+    if count:
+        print(f"{count} violation(s)")
+        sys.exit(1)
+    print("ok")